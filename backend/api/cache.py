@@ -0,0 +1,135 @@
+import hashlib
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from rest_framework.response import Response
+
+
+def make_key(namespace, *parts):
+    """Ключ кэша вида `namespace:part:part`"""
+    return ":".join(str(part) for part in (namespace, *parts))
+
+
+def get_version(namespace):
+    """Версия пространства имен — время его последнего изменения"""
+    key = make_key(namespace, "version")
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, time.time(), settings.CACHE_VERSION_TIMEOUT)
+        version = cache.get(key, time.time())
+    return version
+
+
+def bump_version(namespace):
+    """Новая версия всегда в следующей целой секунде или позже
+
+    Last-Modified ответа — целые секунды версии: без этого изменение в
+    ту же секунду, что и прошлый ответ, получало бы 304 по If-Modified-Since.
+    """
+    key = make_key(namespace, "version")
+    version = time.time()
+    old = cache.get(key)
+    if old is not None:
+        version = max(version, int(old) + 1)
+    cache.set(key, version, settings.CACHE_VERSION_TIMEOUT)
+
+
+def record_lookup(namespace, hit, count=1):
+    if not count:
+        return
+    key = make_key("stats", namespace, "hits" if hit else "misses")
+    cache.add(key, 0, None)
+    try:
+        cache.incr(key, count)
+    except ValueError:
+        pass
+
+
+def recipe_fragment_key(recipe, version):
+    """Ключ фрагмента рецепта, меняется с каждой записью рецепта
+
+    Удаление ключа после записи не спасает от чтения, начатого до нее:
+    оно положит в кэш старый фрагмент уже после удаления. С `modified`
+    в ключе такой фрагмент ляжет под ключ, который больше не читают.
+    """
+    modified = int(recipe.modified.timestamp() * 1000000)
+    return make_key("recipes", version, "fragment", recipe.pk, modified)
+
+
+def get_stats(namespace):
+    hits_key = make_key("stats", namespace, "hits")
+    misses_key = make_key("stats", namespace, "misses")
+    stats = cache.get_many([hits_key, misses_key])
+    return stats.get(hits_key, 0), stats.get(misses_key, 0)
+
+
+def cache_response(method):
+    """Кэширование ответа вьюсета в пространстве имен `cache_namespace`
+
+    Ключ зависит от версии пространства имен, полного пути запроса,
+    формата ответа и, если `cache_vary_on_user`, от пользователя.
+    Повторный запрос отдается из кэша без обращения к базе и сериализатора,
+    а при совпадении ETag или Last-Modified — ответом 304.
+    """
+
+    @wraps(method)
+    def wrapper(self, request, *args, **kwargs):
+        namespace = self.cache_namespace
+        version = get_version(namespace)
+        user = "anon"
+        if self.cache_vary_on_user and request.user.is_authenticated:
+            user = request.user.pk
+        digest = hashlib.md5(
+            make_key(
+                namespace,
+                version,
+                user,
+                request.accepted_renderer.format,
+                request.get_full_path(),
+            ).encode()
+        ).hexdigest()
+        etag = quote_etag(digest)
+        last_modified = int(version)
+        not_modified = get_conditional_response(
+            request, etag=etag, last_modified=last_modified
+        )
+        if not_modified is not None:
+            record_lookup(namespace, hit=True)
+            return not_modified
+
+        key = make_key(namespace, "response", digest)
+        data = cache.get(key)
+        record_lookup(namespace, hit=data is not None)
+        if data is None:
+            response = method(self, request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+            data = response.data
+            cache.set(key, data, self.cache_timeout)
+        response = Response(data)
+        response["ETag"] = etag
+        response["Last-Modified"] = http_date(last_modified)
+        return response
+
+    return wrapper
+
+
+class CachedResponseMixin:
+    """Кэширование list и retrieve вьюсета"""
+
+    cache_namespace = None
+    cache_vary_on_user = False
+    cache_timeout = DEFAULT_TIMEOUT
+
+    @cache_response
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    @cache_response
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
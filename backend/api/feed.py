@@ -0,0 +1,88 @@
+from django.conf import settings
+from django.db.models import Q
+
+from recipes.models import FeedEntry, Follow, Recipe
+
+FEED_ORDERING = ("-pub_date", "-recipe_id")
+BATCH_SIZE = 1000
+
+
+def fan_out_recipe(recipe):
+    """Раскладывает новый рецепт по лентам подписчиков автора
+
+    Рецепты авторов, у которых подписчиков больше `FEED_FANOUT_LIMIT`,
+    не раскладываются, а читаются из ленты подписчика при запросе.
+    """
+    if recipe.author.followers_count > settings.FEED_FANOUT_LIMIT:
+        return
+    followers = Follow.objects.filter(author_id=recipe.author_id)
+    FeedEntry.objects.bulk_create(
+        [
+            FeedEntry(
+                user_id=user_id,
+                author_id=recipe.author_id,
+                recipe=recipe,
+                pub_date=recipe.pub_date,
+            )
+            for user_id in followers.values_list("user_id", flat=True)
+        ],
+        batch_size=BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+    Recipe.objects.filter(pk=recipe.pk).update(fanned_out=True)
+    recipe.fanned_out = True
+
+
+def backfill_feed(user, author):
+    """Добавляет в ленту новой подписки уже разосланные рецепты автора"""
+    recipes = Recipe.objects.filter(author=author, fanned_out=True)
+    FeedEntry.objects.bulk_create(
+        [
+            FeedEntry(
+                user=user,
+                author_id=author.pk,
+                recipe_id=recipe_id,
+                pub_date=pub_date,
+            )
+            for recipe_id, pub_date in recipes.values_list("id", "pub_date")
+        ],
+        batch_size=BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+
+
+def drop_feed(user, author):
+    FeedEntry.objects.filter(user=user, author=author).delete()
+
+
+class Feed:
+    """Лента подписок: разосланные записи плюс неразосланные рецепты
+
+    Обе части читаются по индексу в порядке `(pub_date, id)` от позиции
+    курсора и сливаются, поэтому страница стоит двух коротких запросов.
+    """
+
+    def __init__(self, user):
+        self.user = user
+
+    def get_keys(self, position, limit):
+        entries = FeedEntry.objects.filter(user=self.user)
+        pulled = Recipe.objects.filter(
+            fanned_out=False,
+            author__in=Follow.objects.filter(user=self.user).values("author"),
+        )
+        if position is not None:
+            pub_date, recipe_id = position
+            entries = entries.filter(
+                Q(pub_date__lt=pub_date)
+                | Q(pub_date=pub_date, recipe_id__lt=recipe_id)
+            )
+            pulled = pulled.filter(
+                Q(pub_date__lt=pub_date)
+                | Q(pub_date=pub_date, id__lt=recipe_id)
+            )
+        entries = entries.order_by(*FEED_ORDERING)
+        pulled = pulled.order_by("-pub_date", "-id")
+        keys = set(entries.values_list("pub_date", "recipe_id")[:limit])
+        keys.update(pulled.values_list("pub_date", "id")[:limit])
+        return sorted(keys, reverse=True)[:limit]
@@ -1,27 +1,56 @@
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db.models import Exists, OuterRef
 from django_filters.rest_framework import FilterSet
 from django_filters.rest_framework.filters import (
-    AllValuesMultipleFilter,
     BooleanFilter,
+    CharFilter,
+    ChoiceFilter,
     ModelChoiceFilter,
+    MultipleChoiceFilter,
 )
-from rest_framework.filters import SearchFilter
 from rest_framework.serializers import ValidationError
 
-from recipes.models import Recipe
+from .cache import get_version, make_key
+from .search import search_recipes
+from recipes.models import Recipe, RecipeTag, Tag
 
 User = get_user_model()
 
+TAG_IDS_TIMEOUT = 60 * 60 * 24
+ORDERINGS = {
+    "popular": ("-popularity_score", "-id"),
+    "trending": ("-trending_score", "-id"),
+}
 
-class IngredientSearchFilter(SearchFilter):
-    search_param = "name"
+
+def get_tag_ids():
+    """Соответствие slug -> id тегов из кэша справочника"""
+    key = make_key("tags", get_version("tags"), "ids")
+    tag_ids = cache.get(key)
+    if tag_ids is None:
+        tag_ids = dict(Tag.objects.values_list("slug", "id"))
+        cache.set(key, tag_ids, TAG_IDS_TIMEOUT)
+    return tag_ids
+
+
+def get_tag_choices():
+    return [(slug, slug) for slug in get_tag_ids()]
 
 
 class RecipeFilter(FilterSet):
-    tags = AllValuesMultipleFilter(field_name="tags__slug")
+    tags = MultipleChoiceFilter(
+        choices=get_tag_choices,
+        method="get_tags",
+    )
     author = ModelChoiceFilter(queryset=User.objects.all())
     is_favorited = BooleanFilter(method="get_is_favorited")
     is_in_shopping_cart = BooleanFilter(method="get_is_in_shopping_cart")
+    search = CharFilter(method="get_search")
+    ordering = ChoiceFilter(
+        choices=[(name, name) for name in ORDERINGS],
+        method="get_ordering",
+    )
 
     class Meta:
         model = Recipe
@@ -30,6 +59,23 @@ class RecipeFilter(FilterSet):
             "author",
         ]
 
+    def get_tags(self, queryset, name, value):
+        tag_ids = get_tag_ids()
+        return queryset.filter(
+            Exists(
+                RecipeTag.objects.filter(
+                    recipe=OuterRef("pk"),
+                    tag_id__in=[tag_ids[slug] for slug in value],
+                )
+            )
+        )
+
+    def get_search(self, queryset, name, value):
+        return search_recipes(queryset, value)
+
+    def get_ordering(self, queryset, name, value):
+        return queryset.order_by(*ORDERINGS[value])
+
     def get_is_favorited(self, queryset, name, value):
         if value and self.request.user.is_authenticated:
             return queryset.filter(favorite__user=self.request.user)
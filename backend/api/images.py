@@ -0,0 +1,136 @@
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connections
+from django.utils.timezone import now
+from PIL import Image, ImageOps, features
+
+from recipes.models import Recipe
+
+logger = logging.getLogger(__name__)
+
+VARIANTS_DIR = "recipes/images/variants"
+FORMATS = {
+    "jpeg": ("JPEG", {"quality": 82, "optimize": True, "progressive": True}),
+}
+if features.check("webp"):
+    FORMATS["webp"] = ("WEBP", {"quality": 80, "method": 4})
+
+_executor = None
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.RECIPE_IMAGE_WORKERS,
+            thread_name_prefix="recipe-images",
+        )
+    return _executor
+
+
+def to_rgb(image):
+    """RGB копия картинки, прозрачные области заливаются белым"""
+    if image.mode in ("RGBA", "LA") or "transparency" in image.info:
+        image = image.convert("RGBA")
+        background = Image.new("RGBA", image.size, "white")
+        return Image.alpha_composite(background, image).convert("RGB")
+    return image.convert("RGB")
+
+
+def render_variants(image_file, stem):
+    """Сохраняет уменьшенные копии во всех форматах, без EXIF"""
+    with Image.open(image_file) as original:
+        icc_profile = original.info.get("icc_profile")
+        original = to_rgb(ImageOps.exif_transpose(original))
+    variants = {}
+    for name, width in settings.RECIPE_IMAGE_VARIANTS.items():
+        image = original
+        if image.width > width:
+            height = max(1, round(image.height * width / image.width))
+            image = image.resize((width, height), Image.LANCZOS)
+        variant = {"width": image.width, "height": image.height}
+        for extension, (image_format, options) in FORMATS.items():
+            buffer = BytesIO()
+            image.save(
+                buffer, image_format, icc_profile=icc_profile, **options
+            )
+            variant[extension] = default_storage.save(
+                f"{VARIANTS_DIR}/{stem}-{name}.{extension}",
+                ContentFile(buffer.getvalue()),
+            )
+        variants[name] = variant
+    return variants
+
+
+def variant_files(variants):
+    return [
+        variant[extension]
+        for variant in variants.values()
+        for extension in FORMATS
+        if extension in variant
+    ]
+
+
+def delete_variants(variants):
+    for name in variant_files(variants):
+        default_storage.delete(name)
+
+
+def build_image_variants(recipe_id, image_name, stale_variants=None):
+    """Готовит копии картинки рецепта и записывает их в `image_variants`
+
+    `stale_variants` — копии прежней картинки, которые уже сброшены в базе
+    при ее замене, они удаляются в любом случае. Если пока шла обработка
+    картинку рецепта заменили или рецепт удалили, готовые копии удаляются,
+    а старые копии удаляются после записи новых.
+    """
+    try:
+        if stale_variants:
+            delete_variants(stale_variants)
+        stem = os.path.splitext(os.path.basename(image_name))[0]
+        with default_storage.open(image_name) as image_file:
+            variants = render_variants(image_file, stem)
+        recipe = Recipe.objects.filter(pk=recipe_id, image=image_name)
+        old = recipe.values_list("image_variants", flat=True).first()
+        if old is None or not recipe.update(
+            image_variants=variants, modified=now()
+        ):
+            delete_variants(variants)
+            return
+        delete_variants(old)
+    except Exception:
+        logger.exception("image variants of recipe %s failed", recipe_id)
+
+
+def build_in_worker(recipe_id, image_name, stale_variants=None):
+    try:
+        build_image_variants(recipe_id, image_name, stale_variants)
+    finally:
+        connections.close_all()
+
+
+def schedule_image_variants(recipe_id, image_name, stale_variants=None):
+    """Обработка картинки в пуле потоков, без пула — сразу"""
+    if settings.RECIPE_IMAGE_WORKERS <= 0:
+        build_image_variants(recipe_id, image_name, stale_variants)
+        return
+    get_executor().submit(
+        build_in_worker, recipe_id, image_name, stale_variants
+    )
+
+
+def get_variant_urls(variants):
+    """Карта `{размер: {width, height, формат: url}}` для srcset"""
+    return {
+        name: {
+            key: default_storage.url(value) if key in FORMATS else value
+            for key, value in variant.items()
+        }
+        for name, variant in variants.items()
+    }
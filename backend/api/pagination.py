@@ -1,6 +1,248 @@
+import base64
+import binascii
+import hashlib
+import json
+from collections import OrderedDict
+from datetime import date, datetime
+
+from django.core.cache import cache
+from django.core.exceptions import (
+    EmptyResultSet,
+    FieldDoesNotExist,
+    ValidationError,
+)
+from django.core.paginator import EmptyPage, Page, PageNotAnInteger
+from django.core.paginator import Paginator as DjangoPaginator
+from django.db import connections
+from django.db.models import Q, QuerySet
+from django.utils.functional import cached_property
+from rest_framework.exceptions import NotFound
 from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from .cache import make_key
+from recipes.models import FeedEntry
+
+
+def encode_value(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+class EstimatedPage(Page):
+    has_more = None
+
+    def has_next(self):
+        if self.has_more is None:
+            return super().has_next()
+        return self.has_more
+
+
+class EstimatedCountPaginator(DjangoPaginator):
+    """Пагинатор с оценочным count для больших выборок
+
+    Точный COUNT выполняется, если оценка планировщика PostgreSQL меньше
+    `exact_count_threshold` или базы другие. Оценка хранится в кэше
+    `count_cache_timeout` секунд под ключом из SQL запроса, поэтому
+    одинаковые фильтры в любом порядке параметров делят одну запись.
+    Точный count не кэшируется: с устаревшим значением страницы теряли бы
+    новые записи.
+    """
+
+    exact_count_threshold = 10000
+    count_cache_timeout = 60
+
+    @cached_property
+    def count_info(self):
+        if not isinstance(self.object_list, QuerySet):
+            return len(self.object_list), True
+        queryset = self.object_list.order_by().values("pk")
+        try:
+            sql = str(queryset.query)
+        except EmptyResultSet:
+            return 0, True
+        key = make_key("counts", hashlib.md5(sql.encode()).hexdigest())
+        estimate = cache.get(key)
+        if estimate is not None:
+            return estimate, False
+        estimate = self.estimate_count(queryset)
+        if estimate is not None and estimate >= self.exact_count_threshold:
+            cache.set(key, estimate, self.count_cache_timeout)
+            return estimate, False
+        return queryset.count(), True
+
+    @property
+    def count(self):
+        return self.count_info[0]
+
+    @property
+    def count_exact(self):
+        return self.count_info[1]
+
+    def estimate_count(self, queryset):
+        connection = connections[queryset.db]
+        if connection.vendor != "postgresql":
+            return None
+        sql, params = queryset.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute("EXPLAIN (FORMAT JSON) " + sql, params)
+            plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return int(plan[0]["Plan"]["Plan Rows"])
+
+    def validate_number(self, number):
+        if self.count_exact:
+            return super().validate_number(number)
+        try:
+            number = int(number)
+        except (TypeError, ValueError):
+            raise PageNotAnInteger("That page number is not an integer")
+        if number < 1:
+            raise EmptyPage("That page number is less than 1")
+        return number
+
+    def page(self, number):
+        number = self.validate_number(number)
+        if self.count_exact:
+            return super().page(number)
+        bottom = (number - 1) * self.per_page
+        top = bottom + self.per_page + 1
+        items = list(self.object_list[bottom:top])
+        if not items and number > 1:
+            raise EmptyPage("That page contains no results")
+        page = self._get_page(items[: self.per_page], number, self)
+        page.has_more = len(items) > self.per_page
+        return page
+
+    def _get_page(self, *args, **kwargs):
+        return EstimatedPage(*args, **kwargs)
 
 
 class ApiPagination(PageNumberPagination):
+    """Постраничная пагинация с курсорным режимом по запросу клиента
+
+    По умолчанию работает `page`/`limit`, а поле `count_exact` ответа
+    показывает, точное ли значение `count`. Если в запросе есть параметр
+    `cursor` (для первой страницы пустой), страница выбирается по ключу
+    сортировки queryset, например `(pub_date, id)`, без OFFSET и COUNT.
+    """
+
+    django_paginator_class = EstimatedCountPaginator
     page_size = 6
     page_size_query_param = "limit"
+    cursor_query_param = "cursor"
+    invalid_cursor_message = "Некорректный курсор."
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.cursor_mode = self.cursor_query_param in request.query_params
+        if not isinstance(queryset, QuerySet):
+            self.cursor_mode = False
+        if not self.cursor_mode:
+            return super().paginate_queryset(queryset, request, view)
+        self.request = request
+        page_size = self.get_page_size(request)
+        ordering = self.get_ordering(queryset)
+        position = self.decode_cursor(request, queryset.model, ordering)
+        if position is not None:
+            queryset = queryset.filter(
+                self.get_keyset_filter(ordering, position)
+            )
+        items = list(queryset.order_by(*ordering)[: page_size + 1])
+        page = items[:page_size]
+        self.next_position = None
+        if len(items) > page_size:
+            self.next_position = [
+                getattr(page[-1], field.lstrip("-")) for field in ordering
+            ]
+        return page
+
+    def get_ordering(self, queryset):
+        ordering = list(
+            queryset.query.order_by or queryset.model._meta.ordering or []
+        )
+        if not {"pk", "id"} & {field.lstrip("-") for field in ordering}:
+            last = ordering[-1] if ordering else "id"
+            ordering.append("-id" if last.startswith("-") else "id")
+        return ordering
+
+    def get_keyset_filter(self, ordering, position):
+        """Условие «после позиции» для лексикографического порядка"""
+        keyset = Q()
+        for index, field in enumerate(ordering):
+            name = field.lstrip("-")
+            lookup = "lt" if field.startswith("-") else "gt"
+            condition = Q(**{f"{name}__{lookup}": position[index]})
+            for previous, value in zip(ordering[:index], position):
+                condition &= Q(**{previous.lstrip("-"): value})
+            keyset |= condition
+        return keyset
+
+    def decode_cursor(self, request, model, ordering):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            position = json.loads(base64.urlsafe_b64decode(encoded.encode()))
+            if len(position) != len(ordering):
+                raise ValueError
+            return [
+                self.to_python(model, field.lstrip("-"), value)
+                for field, value in zip(ordering, position)
+            ]
+        except (binascii.Error, TypeError, ValueError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def to_python(self, model, name, value):
+        try:
+            field = model._meta.get_field(name)
+        except FieldDoesNotExist:
+            return value
+        return field.to_python(value)
+
+    def encode_cursor(self, position):
+        encoded = base64.urlsafe_b64encode(
+            json.dumps(position, default=encode_value).encode()
+        ).decode()
+        url = remove_query_param(
+            self.request.build_absolute_uri(), self.page_query_param
+        )
+        return replace_query_param(url, self.cursor_query_param, encoded)
+
+    def get_paginated_response(self, data):
+        if not self.cursor_mode:
+            return Response(
+                OrderedDict(
+                    [
+                        ("count", self.page.paginator.count),
+                        ("count_exact", self.page.paginator.count_exact),
+                        ("next", self.get_next_link()),
+                        ("previous", self.get_previous_link()),
+                        ("results", data),
+                    ]
+                )
+            )
+        next_link = None
+        if self.next_position is not None:
+            next_link = self.encode_cursor(self.next_position)
+        return Response(OrderedDict([("next", next_link), ("results", data)]))
+
+
+class FeedPagination(ApiPagination):
+    """Курсорная пагинация ленты подписок, см. `api.feed.Feed`"""
+
+    ordering = ["-pub_date", "-recipe_id"]
+
+    def paginate_queryset(self, feed, request, view=None):
+        self.cursor_mode = True
+        self.request = request
+        page_size = self.get_page_size(request)
+        position = self.decode_cursor(request, FeedEntry, self.ordering)
+        keys = feed.get_keys(position, page_size + 1)
+        page = keys[:page_size]
+        self.next_position = None
+        if len(keys) > page_size:
+            self.next_position = list(page[-1])
+        return page
@@ -0,0 +1,28 @@
+import json
+
+from django.utils.datastructures import MultiValueDict
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import DataAndFiles, MultiPartParser
+
+
+class MultiPartJSONParser(MultiPartParser):
+    """multipart/form-data, где поля объекта переданы JSON-строкой в `data`
+
+    Файлы из остальных частей добавляются к полям объекта, поэтому
+    сериализатор получает те же данные, что и из JSON запроса, а файл
+    приходит потоком, без Base64.
+    """
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parsed = super().parse(stream, media_type, parser_context)
+        if "data" not in parsed.data:
+            return parsed
+        try:
+            data = json.loads(parsed.data["data"])
+        except ValueError as error:
+            raise ParseError(f"Некорректный JSON в поле data: {error}")
+        if not isinstance(data, dict):
+            raise ParseError("В поле data ожидается JSON-объект.")
+        # файлы уже в `data`: Request дописал бы их списками значений
+        data.update(parsed.files.dict())
+        return DataAndFiles(data, MultiValueDict())
@@ -0,0 +1,389 @@
+import re
+from array import array
+from bisect import bisect_left
+from collections import Counter, defaultdict
+
+from django.contrib.postgres.search import (
+    SearchHeadline,
+    SearchQuery,
+    SearchRank,
+    TrigramSimilarity,
+)
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import (
+    BooleanField,
+    Case,
+    CharField,
+    F,
+    FloatField,
+    Q,
+    Value,
+    When,
+)
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Cast
+from django.utils.html import escape
+
+from .cache import get_version, make_key
+from recipes.fulltext import sqlite_fts_ready
+from recipes.models import Ingredient, RecipeIngredientAmount
+
+SIMILARITY_THRESHOLD = 0.3
+RECIPE_INDEX_LOG_SIZE = 1000
+RECIPE_INDEX_BATCH_SIZE = 5000
+# совпадения отмечаются управляющими символами, а не тегами: текст
+# рецепта экранируется, и только потом метки заменяются на <b></b>
+SNIPPET_START = "\x02"
+SNIPPET_STOP = "\x03"
+FTS_MATCH_SQL = (
+    "SELECT {} FROM recipes_recipe_fts "
+    "WHERE recipes_recipe_fts MATCH %s AND rowid = recipes_recipe.id"
+)
+
+
+def normalize(value):
+    return value.strip().casefold().replace("ё", "е")
+
+
+def trigrams(value):
+    """Триграммы слов строки по правилам pg_trgm"""
+    grams = set()
+    for word in re.findall(r"\w+", value):
+        padded = "  " + word + " "
+        grams.update(map("".join, zip(padded, padded[1:], padded[2:])))
+    return grams
+
+
+class IngredientIndex:
+    """Индекс ингредиентов в памяти процесса
+
+    Названия хранятся в отсортированном виде, поэтому все совпадения с
+    префиксом лежат подряд, а точное совпадение всегда идет первым.
+    Для нечеткого поиска рядом хранится обратный индекс триграмм.
+    Индекс перестраивается при смене версии справочника ингредиентов.
+    """
+
+    def __init__(self):
+        self._data = None
+
+    def _load(self):
+        version = get_version("ingredients")
+        data = self._data
+        if data is not None and data[0] == version:
+            return data[1:]
+        rows = sorted(
+            (
+                normalize(name),
+                name,
+                {
+                    "id": pk,
+                    "name": name,
+                    "measurement_unit": measurement_unit,
+                },
+            )
+            for pk, name, measurement_unit in Ingredient.objects.values_list(
+                "id", "name", "measurement_unit"
+            )
+        )
+        keys = [key for key, _, _ in rows]
+        postings = defaultdict(list)
+        sizes = []
+        for position, key in enumerate(keys):
+            grams = trigrams(key)
+            sizes.append(len(grams))
+            for gram in grams:
+                postings[gram].append(position)
+        data = (
+            version,
+            keys,
+            [item for _, _, item in rows],
+            dict(postings),
+            sizes,
+        )
+        self._data = data
+        return data[1:]
+
+    def search(self, prefix, limit):
+        keys, items, _, _ = self._load()
+        prefix = normalize(prefix)
+        results = []
+        position = bisect_left(keys, prefix)
+        while (
+            position < len(keys)
+            and len(results) < limit
+            and keys[position].startswith(prefix)
+        ):
+            results.append(items[position])
+            position += 1
+        return results
+
+    def fuzzy_search(self, query, limit):
+        """Поиск по подстроке и с опечатками
+
+        Сначала идут совпадения по началу названия, затем по подстроке,
+        затем остальные по убыванию сходства триграмм.
+        """
+        keys, items, postings, sizes = self._load()
+        query = normalize(query)
+        grams = trigrams(query)
+        shared = Counter()
+        for gram in grams:
+            shared.update(postings.get(gram, ()))
+        if len(query) < 3:
+            shared.update(
+                position
+                for position, key in enumerate(keys)
+                if query in key and position not in shared
+            )
+        ranked = []
+        for position, count in shared.items():
+            key = keys[position]
+            similarity = count / (len(grams) + sizes[position] - count)
+            is_infix = query in key
+            if is_infix or similarity >= SIMILARITY_THRESHOLD:
+                ranked.append(
+                    (
+                        not key.startswith(query),
+                        not is_infix,
+                        -similarity,
+                        key,
+                        position,
+                    )
+                )
+        ranked.sort()
+        return [items[row[-1]] for row in ranked[:limit]]
+
+
+ingredient_index = IngredientIndex()
+
+
+class RecipeIngredientIndex:
+    """Обратный индекс ингредиент -> рецепты в памяти процесса
+
+    Для каждого ингредиента хранится отсортированный массив id рецептов,
+    для каждого рецепта — кортеж его ингредиентов. Изменения рецептов
+    пишутся в кольцевой журнал в кэше из `RECIPE_INDEX_LOG_SIZE` ячеек,
+    по которому остальные процессы перечитывают только изменившиеся
+    рецепты. Индекс строится заново при смене его
+    собственной версии (удаление ингредиента) или если журнал потерян
+    либо отстал больше чем на `RECIPE_INDEX_LOG_SIZE` записей.
+    """
+
+    namespace = "recipe_ingredients"
+
+    def __init__(self):
+        self._version = None
+        self._seq = 0
+        self._postings = {}
+        self._recipes = {}
+
+    def _seq_key(self):
+        return make_key(self.namespace, "seq")
+
+    def _log_key(self, seq):
+        return make_key(self.namespace, "log", seq % RECIPE_INDEX_LOG_SIZE)
+
+    def _rebuild(self, version, seq):
+        postings = defaultdict(lambda: array("i"))
+        recipes = defaultdict(list)
+        rows = (
+            RecipeIngredientAmount.objects.order_by("recipe_id")
+            .values_list("recipe_id", "ingredient_id")
+            .iterator(chunk_size=RECIPE_INDEX_BATCH_SIZE)
+        )
+        for recipe_id, ingredient_id in rows:
+            postings[ingredient_id].append(recipe_id)
+            recipes[recipe_id].append(ingredient_id)
+        self._postings = dict(postings)
+        self._recipes = {
+            recipe_id: tuple(ingredients)
+            for recipe_id, ingredients in recipes.items()
+        }
+        self._version = version
+        self._seq = seq
+
+    def _reload(self, recipe_ids, seq):
+        recipes = {recipe_id: [] for recipe_id in recipe_ids}
+        rows = RecipeIngredientAmount.objects.filter(
+            recipe_id__in=recipe_ids
+        ).values_list("recipe_id", "ingredient_id")
+        for recipe_id, ingredient_id in rows:
+            recipes[recipe_id].append(ingredient_id)
+        for recipe_id, ingredients in recipes.items():
+            self._set(recipe_id, ingredients)
+        self._seq = seq
+
+    def _sync(self):
+        version = get_version(self.namespace)
+        seq = cache.get(self._seq_key(), 0)
+        behind = seq - self._seq
+        if (
+            self._version != version
+            or behind < 0
+            or behind > RECIPE_INDEX_LOG_SIZE
+        ):
+            self._rebuild(version, seq)
+            return
+        if not behind:
+            return
+        numbers = range(self._seq + 1, seq + 1)
+        changes = cache.get_many([self._log_key(number) for number in numbers])
+        # ячейка могла быть перезаписана более новым изменением
+        entries = [changes.get(self._log_key(number)) for number in numbers]
+        if any(
+            entry is None or entry[0] != number
+            for number, entry in zip(numbers, entries)
+        ):
+            self._rebuild(version, seq)
+        else:
+            self._reload({recipe_id for _, recipe_id in entries}, seq)
+
+    def _set(self, recipe_id, ingredient_ids):
+        for ingredient_id in self._recipes.pop(recipe_id, ()):
+            recipes = self._postings[ingredient_id]
+            position = bisect_left(recipes, recipe_id)
+            if position < len(recipes) and recipes[position] == recipe_id:
+                del recipes[position]
+        ingredient_ids = tuple(set(ingredient_ids))
+        for ingredient_id in ingredient_ids:
+            recipes = self._postings.setdefault(ingredient_id, array("i"))
+            position = bisect_left(recipes, recipe_id)
+            if position == len(recipes) or recipes[position] != recipe_id:
+                recipes.insert(position, recipe_id)
+        if ingredient_ids:
+            self._recipes[recipe_id] = ingredient_ids
+
+    def mark_changed(self, recipe_id):
+        """Записывает изменение рецепта в журнал для всех процессов"""
+        key = self._seq_key()
+        cache.add(key, 0, None)
+        try:
+            seq = cache.incr(key)
+        except ValueError:
+            return
+        cache.set(self._log_key(seq), (seq, recipe_id), None)
+
+    def update(self, recipe_id, ingredient_ids):
+        """Обновляет рецепт в индексе без перечитывания из базы"""
+        if self._version is not None:
+            self._set(recipe_id, ingredient_ids)
+        self.mark_changed(recipe_id)
+
+    def search(self, ingredient_ids, max_missing=None):
+        """Рецепты по доле своих ингредиентов, которые есть в наборе
+
+        Возвращает список `(id рецепта, совпало, не хватает)`, где первыми
+        идут рецепты с наибольшим покрытием, затем с меньшим числом
+        недостающих ингредиентов и более новые.
+        """
+        self._sync()
+        matched = Counter()
+        for ingredient_id in set(ingredient_ids):
+            matched.update(self._postings.get(ingredient_id, ()))
+        ranked = []
+        for recipe_id, count in matched.items():
+            total = len(self._recipes[recipe_id])
+            missing = total - count
+            if max_missing is None or missing <= max_missing:
+                ranked.append((-count / total, missing, -recipe_id, count))
+        ranked.sort()
+        return [
+            (-recipe_id, count, missing)
+            for _, missing, recipe_id, count in ranked
+        ]
+
+
+recipe_ingredient_index = RecipeIngredientIndex()
+
+
+def search_ingredients_fuzzy(query, limit):
+    """Нечеткий поиск: pg_trgm на PostgreSQL, индекс в памяти иначе"""
+    if connection.vendor != "postgresql":
+        return ingredient_index.fuzzy_search(query, limit)
+    return list(
+        Ingredient.objects.filter(
+            Q(name__icontains=query) | Q(name__trigram_similar=query)
+        )
+        .annotate(
+            is_prefix=Case(
+                When(name__istartswith=query, then=Value(True)),
+                default=Value(False),
+                output_field=BooleanField(),
+            ),
+            is_infix=Case(
+                When(name__icontains=query, then=Value(True)),
+                default=Value(False),
+                output_field=BooleanField(),
+            ),
+            similarity=TrigramSimilarity("name", query),
+        )
+        .order_by("-is_prefix", "-is_infix", "-similarity", "name")
+        .values("id", "name", "measurement_unit")[:limit]
+    )
+
+
+def highlight_snippet(snippet):
+    """HTML фрагмента: текст экранирован, совпадения выделены <b>"""
+    return (
+        escape(snippet)
+        .replace(SNIPPET_START, "<b>")
+        .replace(SNIPPET_STOP, "</b>")
+    )
+
+
+def search_recipes(queryset, query):
+    """Полнотекстовый поиск рецептов по названию и описанию
+
+    Добавляет к рецептам `search_rank` и `search_snippet` с отмеченными
+    совпадениями в описании (см. `highlight_snippet`) и сортирует по
+    убыванию релевантности.
+    На PostgreSQL используется tsvector с русской морфологией, на SQLite —
+    FTS5 с поиском по началу слов.
+    """
+    vendor = connection.vendor
+    if vendor == "postgresql":
+        search_query = SearchQuery(
+            query, config="russian", search_type="websearch"
+        )
+        queryset = queryset.filter(search_vector=search_query).annotate(
+            # ts_rank возвращает real: без приведения к double precision
+            # значение из курсора не равно ключу строки и страницы повторяются
+            search_rank=Cast(
+                SearchRank(F("search_vector"), search_query), FloatField()
+            ),
+            search_snippet=SearchHeadline(
+                "text",
+                search_query,
+                config="russian",
+                start_sel=SNIPPET_START,
+                stop_sel=SNIPPET_STOP,
+            ),
+        )
+    elif vendor == "sqlite" and sqlite_fts_ready(connection):
+        words = re.findall(r"\w+", query)
+        if not words:
+            return queryset.none()
+        match = " ".join(f'"{word}"*' for word in words)
+        queryset = queryset.annotate(
+            search_rank=RawSQL(
+                FTS_MATCH_SQL.format("-bm25(recipes_recipe_fts, 10.0, 1.0)"),
+                (match,),
+                output_field=FloatField(),
+            ),
+            search_snippet=RawSQL(
+                FTS_MATCH_SQL.format(
+                    "snippet(recipes_recipe_fts, 1, %s, %s, '…', 16)"
+                ),
+                (SNIPPET_START, SNIPPET_STOP, match),
+                output_field=CharField(),
+            ),
+        ).filter(search_rank__isnull=False)
+    else:
+        queryset = queryset.filter(
+            Q(name__icontains=query) | Q(text__icontains=query)
+        ).annotate(
+            search_rank=Value(0.0, output_field=FloatField()),
+            search_snippet=Value("", output_field=CharField()),
+        )
+    return queryset.order_by("-search_rank", "-id")
@@ -1,15 +1,32 @@
+from functools import partial
+
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Manager, Prefetch, prefetch_related_objects
 from rest_framework.serializers import (
     Serializer,
     CharField,
     IntegerField,
+    ListSerializer,
     ModelSerializer,
     PrimaryKeyRelatedField,
     SerializerMethodField,
+    ValidationError,
 )
+from rest_framework.permissions import SAFE_METHODS
 from rest_framework.validators import UniqueTogetherValidator
 
-from .utils import Base64ImageField, Hex2NameColor
+from .cache import get_version, recipe_fragment_key, record_lookup
+from .feed import fan_out_recipe
+from .images import get_variant_urls, schedule_image_variants
+from .search import highlight_snippet, recipe_ingredient_index
+from .utils import (
+    Base64ImageField,
+    BulkPrimaryKeyRelatedField,
+    Hex2NameColor,
+)
 from .validators import (
     RecipeIngredientsAmountValidator,
     RecipeIngredientsValidator,
@@ -17,7 +34,7 @@ from .validators import (
     UserNotAuthorValidator,
     RecipeCookingTimeValidator,
 )
-from cart.models import ShoppingCart
+from cart.models import ShoppingCart, ShoppingListItem
 from recipes.models import (
     Favorite,
     Follow,
@@ -34,6 +51,9 @@ User = get_user_model()
 class IsSubscribedSerializer(Serializer):
     def get_is_subscribed(self, obj):
         """Проверка статуса подписки"""
+        annotated = getattr(obj, "is_subscribed", None)
+        if annotated is not None:
+            return annotated
         user = self.context.get("request").user
         return (
             user.is_authenticated
@@ -81,12 +101,38 @@ class IngredientSerializer(ModelSerializer):
         fields = "__all__"
 
 
+class RecipeIngredientAmountListSerializer(ListSerializer):
+    """Ингредиенты рецепта, которые читаются из базы одним запросом
+
+    Ошибка про несуществующий ингредиент возвращается на его месте
+    в списке, как и остальные ошибки отдельных ингредиентов.
+    """
+
+    def to_internal_value(self, data):
+        items = super().to_internal_value(data)
+        ingredients = Ingredient.objects.in_bulk(
+            {item["ingredient_id"] for item in items}
+        )
+        errors = []
+        for item in items:
+            ingredient = ingredients.get(item["ingredient_id"])
+            if ingredient is None:
+                message = "Ингредиента с id {} не существует.".format(
+                    item["ingredient_id"]
+                )
+                errors.append({"id": [message]})
+            else:
+                item["ingredient"] = ingredient
+                errors.append({})
+        if any(errors):
+            raise ValidationError(errors)
+        return items
+
+
 class RecipeIngredientAmountSerializer(ModelSerializer):
     """Сериализатор для ингредиентов рецепта"""
 
-    id = PrimaryKeyRelatedField(
-        queryset=Ingredient.objects.all(), source="ingredient.id"
-    )
+    id = IntegerField(source="ingredient_id")
     name = CharField(
         source="ingredient.name",
         read_only=True,
@@ -98,6 +144,7 @@ class RecipeIngredientAmountSerializer(ModelSerializer):
 
     class Meta:
         model = RecipeIngredientAmount
+        list_serializer_class = RecipeIngredientAmountListSerializer
         validators = [
             RecipeIngredientsAmountValidator(amount="amount"),
         ]
@@ -109,10 +156,108 @@ class RecipeIngredientAmountSerializer(ModelSerializer):
         )
 
 
+class RecipeAuthorSerializer(ModelSerializer):
+    """Сериализатор автора рецепта без статуса подписки"""
+
+    class Meta:
+        model = User
+        fields = (
+            "email",
+            "id",
+            "username",
+            "first_name",
+            "last_name",
+        )
+
+
+class RecipeFragmentSerializer(ModelSerializer):
+    """Не зависящая от пользователя часть рецепта, которая хранится в кэше"""
+
+    tags = TagSerializer(many=True)
+    author = RecipeAuthorSerializer()
+    image = SerializerMethodField()
+    image_variants = SerializerMethodField()
+    ingredients = RecipeIngredientAmountSerializer(
+        source="recipe_ingredient_amount",
+        many=True,
+    )
+
+    class Meta:
+        model = Recipe
+        fields = (
+            "tags",
+            "author",
+            "name",
+            "image",
+            "image_variants",
+            "text",
+            "cooking_time",
+            "id",
+            "ingredients",
+        )
+
+    def get_image(self, obj):
+        return obj.image.url if obj.image else None
+
+    def get_image_variants(self, obj):
+        return get_variant_urls(obj.image_variants)
+
+
+def get_recipe_fragments(recipes, store=True):
+    """Фрагменты рецептов из кэша, недостающие собираются одним проходом
+
+    С `store=False` собранные фрагменты не кэшируются: так отвечают на
+    запись, чтобы объект из памяти не затер изменения фоновой обработки.
+    """
+    version = get_version("recipes")
+    keys = {
+        recipe.pk: recipe_fragment_key(recipe, version) for recipe in recipes
+    }
+    cached = cache.get_many(keys.values())
+    fragments = {pk: cached[key] for pk, key in keys.items() if key in cached}
+    missed = [recipe for recipe in recipes if recipe.pk not in fragments]
+    record_lookup("recipes", hit=True, count=len(fragments))
+    record_lookup("recipes", hit=False, count=len(missed))
+    if missed:
+        prefetch_related_objects(
+            missed,
+            "author",
+            "tags",
+            Prefetch(
+                "recipe_ingredient_amount",
+                queryset=RecipeIngredientAmount.objects.select_related(
+                    "ingredient"
+                ),
+            ),
+        )
+        serializer = RecipeFragmentSerializer()
+        built = {
+            recipe.pk: serializer.to_representation(recipe)
+            for recipe in missed
+        }
+        if store:
+            cache.set_many(
+                {keys[pk]: fragment for pk, fragment in built.items()},
+                settings.CACHE_LONG_TIMEOUT,
+            )
+        fragments.update(built)
+    return fragments
+
+
+class RecipeListSerializer(ListSerializer):
+    def to_representation(self, data):
+        recipes = list(data.all() if isinstance(data, Manager) else data)
+        fragments = get_recipe_fragments(recipes)
+        return [
+            self.child.personalize(recipe, fragments[recipe.pk])
+            for recipe in recipes
+        ]
+
+
 class RecipeSerializer(ModelSerializer):
     """Сериализатор для рецептов"""
 
-    tags = TagSerializer(many=True, read_only=True)
+    tags = BulkPrimaryKeyRelatedField(queryset=Tag.objects.all())
     author = CustomUserSerializer(read_only=True)
     is_favorited = SerializerMethodField()
     is_in_shopping_cart = SerializerMethodField()
@@ -126,6 +271,7 @@ class RecipeSerializer(ModelSerializer):
 
     class Meta:
         model = Recipe
+        list_serializer_class = RecipeListSerializer
         validators = [
             RecipeCookingTimeValidator(cooking_time="cooking_time"),
             RecipeIngredientsValidator(ingredients="ingredients"),
@@ -137,13 +283,17 @@ class RecipeSerializer(ModelSerializer):
             "is_in_shopping_cart",
             "name",
             "image",
+            "image_variants",
             "text",
             "cooking_time",
             "id",
             "ingredients",
         )
 
-    def _check_fields(self, model, obj):
+    def _check_fields(self, model, obj, annotation):
+        annotated = getattr(obj, annotation, None)
+        if annotated is not None:
+            return annotated
         user = self.context["request"].user
         return (
             user.is_authenticated
@@ -151,48 +301,183 @@ class RecipeSerializer(ModelSerializer):
         )
 
     def get_is_favorited(self, obj):
-        return self._check_fields(Favorite, obj)
+        return self._check_fields(Favorite, obj, "is_favorited")
 
     def get_is_in_shopping_cart(self, obj):
-        return self._check_fields(ShoppingCart, obj)
+        return self._check_fields(ShoppingCart, obj, "is_in_shopping_cart")
+
+    def get_is_author_subscribed(self, obj):
+        annotated = getattr(obj, "is_author_subscribed", None)
+        if annotated is not None:
+            return annotated
+        user = self.context["request"].user
+        return (
+            user.is_authenticated
+            and user.follow_user.filter(author_id=obj.author_id).exists()
+        )
 
-    def _create_or_update(self, recipe, data_ingredients):
-        tags_objs = [
-            RecipeTag(recipe=recipe, tag=Tag.objects.get(id=tag))
-            for tag in data_ingredients.data["tags"]
+    def personalize(self, instance, fragment):
+        """Добавление к кэшированному фрагменту полей пользователя"""
+        request = self.context.get("request")
+        image = fragment["image"]
+        variants = fragment["image_variants"]
+        if request is not None:
+            if image:
+                image = request.build_absolute_uri(image)
+            variants = {
+                name: {
+                    key: (
+                        request.build_absolute_uri(value)
+                        if isinstance(value, str)
+                        else value
+                    )
+                    for key, value in variant.items()
+                }
+                for name, variant in variants.items()
+            }
+        personal = {
+            "author": dict(
+                fragment["author"],
+                is_subscribed=self.get_is_author_subscribed(instance),
+            ),
+            "is_favorited": self.get_is_favorited(instance),
+            "is_in_shopping_cart": self.get_is_in_shopping_cart(instance),
+            "image": image,
+            "image_variants": variants,
+        }
+        data = {
+            field: personal[field] if field in personal else fragment[field]
+            for field in self.Meta.fields
+        }
+        snippet = getattr(instance, "search_snippet", None)
+        if snippet is not None:
+            data["search_snippet"] = highlight_snippet(snippet)
+        return data
+
+    def _set_tags(self, recipe, tags, current=()):
+        """Добавляет и удаляет только изменившиеся теги рецепта"""
+        tag_ids = {tag.pk for tag in tags}
+        current = set(current)
+        removed = current - tag_ids
+        if removed:
+            RecipeTag.objects.filter(
+                recipe=recipe, tag_id__in=removed
+            ).delete()
+        RecipeTag.objects.bulk_create(
+            [
+                RecipeTag(recipe=recipe, tag_id=tag_id)
+                for tag_id in tag_ids - current
+            ]
+        )
+
+    def _set_ingredients(self, recipe, amounts, rows=()):
+        """Применяет к ингредиентам рецепта только разницу со строками `rows`
+
+        Удаляются строки пропавших ингредиентов, у оставшихся обновляется
+        количество, если оно изменилось, новые ингредиенты добавляются.
+        """
+        rows = {row.ingredient_id: row for row in rows}
+        removed = [
+            row.pk
+            for ingredient_id, row in rows.items()
+            if ingredient_id not in amounts
         ]
-        RecipeTag.objects.bulk_create(tags_objs)
+        if removed:
+            RecipeIngredientAmount.objects.filter(pk__in=removed).delete()
+        changed = []
+        added = []
+        for ingredient_id, amount in amounts.items():
+            row = rows.get(ingredient_id)
+            if row is None:
+                added.append(
+                    RecipeIngredientAmount(
+                        recipe=recipe,
+                        ingredient_id=ingredient_id,
+                        amount=amount,
+                    )
+                )
+            elif row.amount != amount:
+                row.amount = amount
+                changed.append(row)
+        RecipeIngredientAmount.objects.bulk_update(changed, ["amount"])
+        RecipeIngredientAmount.objects.bulk_create(added)
+        if removed or added:
+            transaction.on_commit(
+                partial(
+                    recipe_ingredient_index.update, recipe.pk, list(amounts)
+                )
+            )
 
-        ingr_objs = [
-            RecipeIngredientAmount(
-                recipe=recipe,
-                ingredient_id=ingredient.get("id"),
-                amount=ingredient.get("amount"),
+    @staticmethod
+    def _get_amounts(ingredients):
+        return {item["ingredient_id"]: item["amount"] for item in ingredients}
+
+    def _schedule_image_variants(self, recipe, stale_variants=None):
+        transaction.on_commit(
+            partial(
+                schedule_image_variants,
+                recipe.pk,
+                recipe.image.name,
+                stale_variants,
             )
-            for ingredient in data_ingredients.data["ingredients"]
-        ]
-        RecipeIngredientAmount.objects.bulk_create(ingr_objs)
-        return recipe
+        )
 
+    @transaction.atomic
     def create(self, validated_data):
-        context = self.context["request"]
-        validated_data.pop("recipe_ingredient_amount")
+        tags = validated_data.pop("tags")
+        ingredients = validated_data.pop("recipe_ingredient_amount")
         recipe = Recipe.objects.create(**validated_data)
-        return self._create_or_update(recipe=recipe, data_ingredients=context)
+        # файл уже сохранен в хранилище, временный файл больше не нужен
+        validated_data["image"].close()
+        self._set_tags(recipe, tags)
+        self._set_ingredients(recipe, self._get_amounts(ingredients))
+        fan_out_recipe(recipe)
+        self._schedule_image_variants(recipe)
+        return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
-        context = self.context["request"]
-        validated_data.pop("recipe_ingredient_amount")
-        super().update(validated_data=validated_data, instance=instance)
-        RecipeIngredientAmount.objects.filter(recipe=instance).delete()
-        RecipeTag.objects.filter(recipe=instance).delete()
-        return self._create_or_update(
-            recipe=instance, data_ingredients=context
+        tags = validated_data.pop("tags", None)
+        ingredients = validated_data.pop("recipe_ingredient_amount", None)
+        upload = validated_data.pop("image", None)
+        stale_variants = None
+        if upload is not None:
+            old_image = instance.image.name
+            # картинка сохраняется до модели, чтобы копии старой картинки
+            # сбросились тем же save, что меняет имя картинки
+            instance.image.save(upload.name, upload, save=False)
+            upload.close()
+            if instance.image.name != old_image:
+                stale_variants = instance.image_variants
+                validated_data["image_variants"] = {}
+        recipe = super().update(
+            instance=instance, validated_data=validated_data
         )
+        if tags is not None:
+            self._set_tags(
+                recipe,
+                tags,
+                RecipeTag.objects.filter(recipe=recipe).values_list(
+                    "tag_id", flat=True
+                ),
+            )
+        if ingredients is not None:
+            rows = list(RecipeIngredientAmount.objects.filter(recipe=recipe))
+            old_amounts = {row.ingredient_id: row.amount for row in rows}
+            amounts = self._get_amounts(ingredients)
+            self._set_ingredients(recipe, amounts, rows)
+            ShoppingListItem.objects.update_recipe(
+                recipe, old_amounts, amounts
+            )
+        if stale_variants is not None:
+            self._schedule_image_variants(recipe, stale_variants)
+        return recipe
 
     def to_representation(self, instance):
-        response = super(RecipeSerializer, self).to_representation(instance)
-        return response
+        request = self.context.get("request")
+        store = request is None or request.method in SAFE_METHODS
+        fragment = get_recipe_fragments([instance], store=store)[instance.pk]
+        return self.personalize(instance, fragment)
 
 
 class SubscribeSerializer(ModelSerializer):
@@ -231,12 +516,22 @@ class RepresentationRecipeSerializer(ModelSerializer):
         )
 
 
+def get_recipes_limit(request):
+    """Параметр `recipes_limit`: целое число не меньше 0 или None"""
+    limit = request.query_params.get("recipes_limit")
+    if limit is None:
+        return None
+    try:
+        return IntegerField(min_value=0).run_validation(limit)
+    except ValidationError as error:
+        raise ValidationError({"recipes_limit": error.detail})
+
+
 class SubscriptionsSerializer(ModelSerializer, IsSubscribedSerializer):
     """Сериализатор для подписок"""
 
     is_subscribed = SerializerMethodField(method_name="get_is_subscribed")
     recipes = SerializerMethodField()
-    recipes_count = SerializerMethodField()
 
     class Meta:
         model = User
@@ -252,12 +547,10 @@ class SubscriptionsSerializer(ModelSerializer, IsSubscribedSerializer):
         )
 
     def get_recipes(self, obj):
-        request = self.context.get("request")
-        limit = request.GET.get("recipes_limit")
-        queryset = Recipe.objects.filter(author=obj)
-        if limit is not None:
-            queryset = Recipe.objects.filter(author=obj)[: int(limit)]
+        queryset = getattr(obj, "prefetched_recipes", None)
+        if queryset is None:
+            limit = get_recipes_limit(self.context.get("request"))
+            queryset = Recipe.objects.filter(author=obj)
+            if limit is not None:
+                queryset = queryset[:limit]
         return RepresentationRecipeSerializer(queryset, many=True).data
-
-    def get_recipes_count(self, obj):
-        return Recipe.objects.filter(author=obj).count()
@@ -0,0 +1,102 @@
+import csv
+from tempfile import SpooledTemporaryFile
+
+from django.conf import settings
+from django.db.models import F
+from django.http import StreamingHttpResponse
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.units import cm
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen import canvas
+
+from cart.models import ShoppingListItem
+
+CHUNK_SIZE = 2000
+FILE_CHUNK_SIZE = 64 * 1024
+PDF_FONT_NAME = "ShoppingCartFont"
+PDF_FONT_SIZE = 12
+PDF_LINE_HEIGHT = 18
+PDF_MARGIN = 2 * cm
+
+
+class Echo:
+    """Псевдо-буфер для csv.writer, отдающий записанную строку"""
+
+    def write(self, value):
+        return value
+
+
+def get_shopping_cart_ingredients(user):
+    """Сводный список покупок пользователя, читаемый курсором"""
+    return (
+        ShoppingListItem.objects.filter(user=user)
+        .values(
+            ingr_name=F("ingredient__name"),
+            unit=F("ingredient__measurement_unit"),
+            amount_sum=F("amount"),
+        )
+        .order_by("ingr_name")
+        .iterator(chunk_size=CHUNK_SIZE)
+    )
+
+
+def render_txt(ingredients):
+    for ingr in ingredients:
+        yield f'{ingr["ingr_name"]}: {ingr["amount_sum"]} {ingr["unit"]}\n'
+
+
+def render_csv(ingredients):
+    writer = csv.writer(Echo())
+    yield writer.writerow(("Ингредиент", "Количество", "Единица измерения"))
+    for ingr in ingredients:
+        yield writer.writerow(
+            (ingr["ingr_name"], ingr["amount_sum"], ingr["unit"])
+        )
+
+
+def render_pdf(ingredients):
+    if PDF_FONT_NAME not in pdfmetrics.getRegisteredFontNames():
+        pdfmetrics.registerFont(
+            TTFont(PDF_FONT_NAME, settings.SHOPPING_CART_PDF_FONT)
+        )
+    with SpooledTemporaryFile(max_size=FILE_CHUNK_SIZE) as buffer:
+        pdf = canvas.Canvas(buffer, pagesize=A4)
+        _, height = A4
+        y = height - PDF_MARGIN
+        pdf.setFont(PDF_FONT_NAME, PDF_FONT_SIZE)
+        pdf.drawString(PDF_MARGIN, y, "Список покупок")
+        y -= 2 * PDF_LINE_HEIGHT
+        for ingr in ingredients:
+            if y < PDF_MARGIN:
+                pdf.showPage()
+                pdf.setFont(PDF_FONT_NAME, PDF_FONT_SIZE)
+                y = height - PDF_MARGIN
+            pdf.drawString(
+                PDF_MARGIN,
+                y,
+                f'{ingr["ingr_name"]}: {ingr["amount_sum"]} {ingr["unit"]}',
+            )
+            y -= PDF_LINE_HEIGHT
+        pdf.save()
+        buffer.seek(0)
+        yield from iter(lambda: buffer.read(FILE_CHUNK_SIZE), b"")
+
+
+SHOPPING_CART_FORMATS = {
+    "txt": ("text/plain; charset=utf-8", render_txt),
+    "csv": ("text/csv; charset=utf-8", render_csv),
+    "pdf": ("application/pdf", render_pdf),
+}
+
+
+def shopping_cart_response(user, file_format):
+    """Потоковая выгрузка списка покупок в выбранном формате"""
+    content_type, render = SHOPPING_CART_FORMATS[file_format]
+    filename = f"{user.username}_shopping_cart.{file_format}"
+    response = StreamingHttpResponse(
+        render(get_shopping_cart_ingredients(user)),
+        content_type=content_type,
+    )
+    response["Content-Disposition"] = f"attachment; filename={filename}"
+    return response
@@ -0,0 +1,49 @@
+from functools import partial
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils.timezone import now
+
+from .cache import bump_version
+from .search import recipe_ingredient_index
+from recipes.models import Ingredient, Recipe, Tag
+from users.models import User
+
+AUTHOR_FRAGMENT_FIELDS = {"email", "username", "first_name", "last_name"}
+
+
+@receiver([post_save, post_delete], sender=Ingredient)
+def bump_ingredients_version(**kwargs):
+    bump_version("ingredients")
+    bump_version("recipes")
+
+
+@receiver(post_delete, sender=Ingredient)
+def bump_recipe_ingredient_index_version(**kwargs):
+    transaction.on_commit(
+        partial(bump_version, recipe_ingredient_index.namespace)
+    )
+
+
+@receiver([post_save, post_delete], sender=Tag)
+def bump_tags_version(**kwargs):
+    bump_version("tags")
+    bump_version("recipes")
+
+
+@receiver(post_delete, sender=Recipe)
+def unindex_recipe_ingredients(instance, **kwargs):
+    transaction.on_commit(
+        partial(recipe_ingredient_index.mark_changed, instance.pk)
+    )
+
+
+@receiver(post_save, sender=User)
+def touch_author_recipes(instance, created, update_fields=None, **kwargs):
+    """Автор входит во фрагменты рецептов: меняем их ключи"""
+    if created or (
+        update_fields and not AUTHOR_FRAGMENT_FIELDS & set(update_fields)
+    ):
+        return
+    instance.recipes.update(modified=now())
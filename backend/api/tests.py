@@ -0,0 +1,902 @@
+import base64
+import csv
+import json
+import os
+import tempfile
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from unittest import skipUnless
+from unittest.mock import patch
+from io import BytesIO, StringIO
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import F, Sum
+from django.http import HttpResponse
+from django.test import SimpleTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from PIL import Image
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
+from rest_framework.test import (
+    APIRequestFactory,
+    APITestCase,
+    force_authenticate,
+)
+from rest_framework.viewsets import ViewSet
+
+from .cache import cache_response, get_stats
+from .pagination import EstimatedCountPaginator
+from .search import (
+    RECIPE_INDEX_LOG_SIZE,
+    RecipeIngredientIndex,
+    recipe_ingredient_index,
+)
+from .serializers import get_recipe_fragments
+from .shopping_cart import shopping_cart_response
+from .utils import Base64ImageField
+from cart.models import ShoppingCart, ShoppingListItem
+from recipes.models import (
+    Favorite,
+    Follow,
+    Ingredient,
+    Recipe,
+    RecipeIngredientAmount,
+    RecipeTag,
+    Tag,
+)
+from users.models import User
+
+# бенчмарки долгие и запускаются только с BENCHMARK=1
+BENCHMARK = bool(os.getenv("BENCHMARK"))
+
+
+def median_time(func, repeat=5):
+    """Медиана времени вызова в миллисекундах"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+def peak_memory(func):
+    """Пик выделенной за вызов памяти в КБ"""
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1] / 1024
+    finally:
+        tracemalloc.stop()
+
+
+def make_png(width=40, height=30):
+    buffer = BytesIO()
+    Image.new("RGB", (width, height), "red").save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+def wrap(text, width=76, newline="\r\n"):
+    """Base64 с переносом строк, как в MIME"""
+    lines = []
+    for start in range(0, len(text), width):
+        end = start + width
+        lines.append(text[start:end])
+    return newline.join(lines)
+
+
+class RecipeDataMixin:
+    """Авторы, теги, ингредиенты и рецепты для тестов API"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user, cls.author = (
+            User.objects.create_user(
+                username=username,
+                email=f"{username}@foodgram.ru",
+                password="password-123",
+                first_name=username,
+                last_name=username,
+            )
+            for username in ("user", "author")
+        )
+        cls.tags = [
+            Tag.objects.create(name=f"tag{i}", slug=f"tag{i}", color="#ffffff")
+            for i in range(3)
+        ]
+        cls.ingredients = [
+            Ingredient.objects.create(
+                name=f"ингредиент{i}", measurement_unit="г"
+            )
+            for i in range(10)
+        ]
+        cls.recipes = []
+        for i in range(30):
+            recipe = Recipe.objects.create(
+                author=(cls.user, cls.author)[i % 2],
+                name=f"рецепт{i}",
+                image="recipes/images/recipe.png",
+                text="описание",
+                cooking_time=10,
+            )
+            RecipeTag.objects.bulk_create(
+                RecipeTag(recipe=recipe, tag=tag) for tag in cls.tags[:2]
+            )
+            RecipeIngredientAmount.objects.bulk_create(
+                RecipeIngredientAmount(
+                    recipe=recipe,
+                    ingredient=cls.ingredients[(i + j) % 10],
+                    amount=j + 1,
+                )
+                for j in range(3)
+            )
+            cls.recipes.append(recipe)
+        for recipe in cls.recipes[::3]:
+            Favorite.objects.create(user=cls.user, recipe=recipe)
+            ShoppingCart.objects.create(user=cls.user, recipe=recipe)
+        Follow.objects.create(user=cls.user, author=cls.author)
+
+    def setUp(self):
+        cache.clear()
+
+
+class RecipeListQueriesTest(RecipeDataMixin, APITestCase):
+    """Число запросов списка рецептов не зависит от размера страницы"""
+
+    def assert_list_queries(self, limit, queries):
+        if connection.vendor == "postgresql":
+            # перед COUNT пагинатор берет оценку планировщика через EXPLAIN
+            queries += 1
+        with self.assertNumQueries(queries):
+            response = self.client.get(f"/api/recipes/?limit={limit}")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data["results"]), limit)
+
+    def test_anonymous(self):
+        for limit in (5, 25):
+            with self.subTest(limit=limit):
+                cache.clear()
+                self.assert_list_queries(limit, 5)
+
+    def test_authenticated(self):
+        self.client.force_authenticate(self.user)
+        for limit in (5, 25):
+            with self.subTest(limit=limit):
+                cache.clear()
+                self.assert_list_queries(limit, 5)
+
+
+class RecipeUpdateChildRowsTest(RecipeDataMixin, APITestCase):
+    """PATCH рецепта пишет только изменившиеся строки тегов и ингредиентов"""
+
+    child_tables = ("recipes_recipetag", "recipes_recipeingredientamount")
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(self.user)
+        self.recipe = self.recipes[0]
+        self.url = f"/api/recipes/{self.recipe.pk}/"
+        self.tag_ids = [tag.pk for tag in self.tags[:2]]
+        self.amounts = [
+            {"id": row.ingredient_id, "amount": row.amount}
+            for row in self.recipe.recipe_ingredient_amount.all()
+        ]
+
+    def patch(self, data):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.patch(self.url, data, format="json")
+        self.assertEqual(response.status_code, 200, response.data)
+        return [
+            (query["sql"].split()[0], table)
+            for query in context.captured_queries
+            for table in self.child_tables
+            if query["sql"].split()[0] in ("INSERT", "UPDATE", "DELETE")
+            and f'"{table}"' in query["sql"]
+        ]
+
+    def test_text_only(self):
+        self.assertEqual(self.patch({"text": "новое описание"}), [])
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.text, "новое описание")
+
+    def test_unchanged_children(self):
+        writes = self.patch(
+            {"tags": self.tag_ids, "ingredients": self.amounts}
+        )
+        self.assertEqual(writes, [])
+
+    def test_mixed_changes(self):
+        kept, changed, removed = self.amounts
+        used = {amount["id"] for amount in self.amounts}
+        added = next(
+            ingredient.pk
+            for ingredient in self.ingredients
+            if ingredient.pk not in used
+        )
+        writes = self.patch(
+            {
+                "tags": [self.tag_ids[0], self.tags[2].pk],
+                "ingredients": [
+                    kept,
+                    {"id": changed["id"], "amount": changed["amount"] + 5},
+                    {"id": added, "amount": 7},
+                ],
+            }
+        )
+        self.assertCountEqual(
+            writes,
+            [
+                ("DELETE", "recipes_recipetag"),
+                ("INSERT", "recipes_recipetag"),
+                ("DELETE", "recipes_recipeingredientamount"),
+                ("UPDATE", "recipes_recipeingredientamount"),
+                ("INSERT", "recipes_recipeingredientamount"),
+            ],
+        )
+        self.assertCountEqual(
+            self.recipe.recipe_ingredient_amount.values_list(
+                "ingredient_id", "amount"
+            ),
+            [
+                (kept["id"], kept["amount"]),
+                (changed["id"], changed["amount"] + 5),
+                (added, 7),
+            ],
+        )
+        self.assertCountEqual(
+            self.recipe.RecipeTag.values_list("tag_id", flat=True),
+            [self.tag_ids[0], self.tags[2].pk],
+        )
+
+
+class RecipeFragmentCacheTest(RecipeDataMixin, APITestCase):
+    """Фрагмент, прочитанный до записи, не возвращается после нее"""
+
+    def test_stale_fragment_after_edit(self):
+        recipe = self.recipes[0]
+        stale = Recipe.objects.get(pk=recipe.pk)
+        self.client.force_authenticate(self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(
+                f"/api/recipes/{recipe.pk}/", {"name": "новое"}, format="json"
+            )
+        self.assertEqual(response.status_code, 200)
+        # чтение, начатое до записи, кэширует старый фрагмент после нее
+        get_recipe_fragments([stale])
+        response = self.client.get(f"/api/recipes/{recipe.pk}/")
+        self.assertEqual(response.data["name"], "новое")
+
+    def test_author_edit(self):
+        recipe = self.recipes[0]
+        self.client.get(f"/api/recipes/{recipe.pk}/")
+        self.user.first_name = "Иван"
+        self.user.save()
+        response = self.client.get(f"/api/recipes/{recipe.pk}/")
+        self.assertEqual(response.data["author"]["first_name"], "Иван")
+
+
+class RecipeSearchCursorTest(RecipeDataMixin, APITestCase):
+    """Курсорные страницы поиска совпадают с полной выдачей"""
+
+    def test_cursor_walk(self):
+        url = "/api/recipes/?" + urlencode({"search": "описание"})
+        response = self.client.get(url + "&limit=100")
+        expected = [recipe["id"] for recipe in response.data["results"]]
+        walked, next_url = [], url + "&limit=7&cursor="
+        while next_url and len(walked) <= len(expected):
+            response = self.client.get(next_url)
+            self.assertEqual(response.status_code, 200)
+            walked += [recipe["id"] for recipe in response.data["results"]]
+            next_url = response.data["next"]
+        self.assertEqual(len(expected), len(self.recipes))
+        self.assertEqual(walked, expected)
+
+
+class RecipeSearchSnippetTest(RecipeDataMixin, APITestCase):
+    """HTML из описания рецепта в `search_snippet` экранируется"""
+
+    def test_html_in_text(self):
+        Recipe.objects.create(
+            author=self.author,
+            name="суп",
+            image="recipes/images/recipe.png",
+            text="hello <img src=x onerror=alert(1)> borsch",
+            cooking_time=10,
+        )
+        response = self.client.get("/api/recipes/?search=borsch")
+        self.assertEqual(response.status_code, 200)
+        (recipe,) = response.data["results"]
+        self.assertEqual(
+            recipe["search_snippet"],
+            "hello &lt;img src=x onerror=alert(1)&gt; <b>borsch</b>",
+        )
+
+
+class RecipeIngredientIndexVersionTest(RecipeDataMixin, APITestCase):
+    """Индекс рецептов по ингредиентам перестраивается при их удалении"""
+
+    def test_rebuild_on_ingredient_delete_only(self):
+        recipe_ingredient_index.search([self.ingredients[0].pk])
+        version = recipe_ingredient_index._version
+        with self.captureOnCommitCallbacks(execute=True):
+            self.tags[0].save()
+            self.ingredients[0].save()
+        recipe_ingredient_index.search([self.ingredients[0].pk])
+        self.assertEqual(recipe_ingredient_index._version, version)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.ingredients[0].delete()
+        matches = recipe_ingredient_index.search([self.ingredients[0].pk])
+        self.assertNotEqual(recipe_ingredient_index._version, version)
+        self.assertEqual(matches, [])
+
+
+class SubscriptionsRecipesLimitTest(RecipeDataMixin, APITestCase):
+    """Некорректный `recipes_limit` возвращает 400, а не ошибку сервера"""
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(self.user)
+
+    def test_limit(self):
+        url = "/api/users/subscriptions/?recipes_limit={}"
+        response = self.client.get(url.format(2))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data["results"][0]["recipes"]), 2)
+        for limit in ("abc", "-1"):
+            with self.subTest(limit=limit):
+                response = self.client.get(url.format(limit))
+                self.assertEqual(response.status_code, 400)
+                self.assertIn("recipes_limit", response.data)
+
+    def test_subscribe_invalid_limit(self):
+        author = User.objects.create_user(
+            username="other", email="other@foodgram.ru", password="pass-123"
+        )
+        response = self.client.post(
+            f"/api/users/{author.pk}/subscribe/?recipes_limit=abc"
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(
+            Follow.objects.filter(user=self.user, author=author).exists()
+        )
+
+
+class RecipeIngredientIndexLogTest(RecipeDataMixin, APITestCase):
+    """Журнал индекса: одна запись на изменение рецепта, ячейки по кругу"""
+
+    def setUp(self):
+        super().setUp()
+        self.index = RecipeIngredientIndex()
+        self.index.search([self.ingredients[0].pk])
+
+    def get_seq(self):
+        return cache.get(self.index._seq_key(), 0)
+
+    def test_one_entry_per_change(self):
+        self.client.force_authenticate(self.user)
+        recipe = self.recipes[0]
+        seq = self.get_seq()
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(
+                f"/api/recipes/{recipe.pk}/",
+                {"ingredients": [{"id": self.ingredients[9].pk, "amount": 1}]},
+                format="json",
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.get_seq(), seq + 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe.delete()
+        self.assertEqual(self.get_seq(), seq + 2)
+        matches = self.index.search([self.ingredients[9].pk])
+        self.assertNotIn(recipe.pk, [recipe_id for recipe_id, _, _ in matches])
+
+    def test_overwritten_slot_rebuilds(self):
+        recipe_ingredient_index.mark_changed(self.recipes[0].pk)
+        recipe_ingredient_index.mark_changed(self.recipes[1].pk)
+        seq = self.get_seq()
+        # запись seq - 1 затерта записью со следующего круга журнала
+        cache.set(
+            self.index._log_key(seq - 1),
+            (seq - 1 + RECIPE_INDEX_LOG_SIZE, self.recipes[2].pk),
+            None,
+        )
+        with patch.object(self.index, "_rebuild") as rebuild:
+            self.index._sync()
+        rebuild.assert_called_once()
+
+
+class CacheSettingsTest(SimpleTestCase):
+    """Выбор бэкенда кэша переменной окружения CACHE_BACKEND"""
+
+    def load_settings(self, backend):
+        return subprocess.run(
+            [
+                sys.executable,
+                "-c",
+                "from foodgram import settings; "
+                "print(settings.CACHES['default']['BACKEND'])",
+            ],
+            cwd=settings.BASE_DIR,
+            env={**os.environ, "CACHE_BACKEND": backend},
+            capture_output=True,
+            text=True,
+        )
+
+    def test_backends(self):
+        for name, backend in (
+            ("locmem", "django.core.cache.backends.locmem.LocMemCache"),
+            ("file", "django.core.cache.backends.filebased.FileBasedCache"),
+            ("redis", "django_redis.cache.RedisCache"),
+        ):
+            with self.subTest(name=name):
+                result = self.load_settings(name)
+                self.assertEqual(result.returncode, 0, result.stderr)
+                self.assertEqual(result.stdout.strip(), backend)
+
+    def test_unknown_backend(self):
+        result = self.load_settings("redsi")
+        self.assertNotEqual(result.returncode, 0)
+        self.assertIn("ImproperlyConfigured", result.stderr)
+        self.assertIn("locmem, file, redis", result.stderr)
+
+
+class WhoAmIViewSet(ViewSet):
+    cache_namespace = "whoami"
+    cache_vary_on_user = True
+    cache_timeout = 60
+
+    @cache_response
+    def list(self, request):
+        return Response({"username": request.user.username})
+
+
+class CachedResponseTest(RecipeDataMixin, APITestCase):
+    """Кэшированные ответы справочников и условные запросы"""
+
+    def get_whoami(self, user=None):
+        request = APIRequestFactory().get("/whoami/")
+        if user is not None:
+            force_authenticate(request, user)
+        return WhoAmIViewSet.as_view({"get": "list"})(request)
+
+    def test_vary_on_user(self):
+        for user, username in (
+            (None, ""),
+            (self.user, "user"),
+            (self.author, "author"),
+            (self.user, "user"),
+            (None, ""),
+        ):
+            with self.subTest(user=username):
+                response = self.get_whoami(user)
+                self.assertEqual(response.data["username"], username)
+        self.assertEqual(get_stats("whoami"), (2, 3))
+
+    def test_hit_and_miss_counters(self):
+        for _ in range(3):
+            self.assertEqual(self.client.get("/api/tags/").status_code, 200)
+        self.assertEqual(get_stats("tags"), (2, 1))
+        stdout = StringIO()
+        call_command("cachestats", "tags", stdout=stdout)
+        self.assertEqual(
+            stdout.getvalue().strip(),
+            "tags: hits 2, misses 1, hit ratio 66.7%",
+        )
+
+    def test_change_in_same_second(self):
+        response = self.client.get("/api/tags/")
+        last_modified = response["Last-Modified"]
+        not_modified = self.client.get(
+            "/api/tags/", HTTP_IF_MODIFIED_SINCE=last_modified
+        )
+        self.assertEqual(not_modified.status_code, 304)
+        self.tags[0].name = "новый"
+        self.tags[0].save()
+        response = self.client.get(
+            "/api/tags/", HTTP_IF_MODIFIED_SINCE=last_modified
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("новый", [tag["name"] for tag in response.data])
+
+
+class EstimatedCountTest(RecipeDataMixin, APITestCase):
+    """Оценочный count: страницы без COUNT, оценка берется из кэша"""
+
+    @patch.object(
+        EstimatedCountPaginator, "estimate_count", return_value=50000
+    )
+    def test_estimated_pages(self, estimate_count):
+        response = self.client.get("/api/recipes/?limit=25")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["count"], 50000)
+        self.assertFalse(response.data["count_exact"])
+        self.assertIsNotNone(response.data["next"])
+        response = self.client.get(response.data["next"])
+        self.assertEqual(len(response.data["results"]), 5)
+        self.assertIsNone(response.data["next"])
+        self.assertEqual(estimate_count.call_count, 1)
+        response = self.client.get("/api/recipes/?limit=25&page=3")
+        self.assertEqual(response.status_code, 404)
+
+    @patch.object(EstimatedCountPaginator, "estimate_count", return_value=40)
+    def test_small_estimate_counts_exactly(self, estimate_count):
+        response = self.client.get("/api/recipes/?limit=25")
+        self.assertEqual(response.data["count"], len(self.recipes))
+        self.assertTrue(response.data["count_exact"])
+
+
+@skipUnless(
+    BENCHMARK and connection.vendor == "postgresql",
+    "benchmark, run with BENCHMARK=1 on PostgreSQL",
+)
+class CountBenchmark(APITestCase):
+    """Список рецептов с точным и оценочным count на большой таблице"""
+
+    recipes = int(os.getenv("BENCHMARK_RECIPES", default=1000000))
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            username="author", email="author@foodgram.ru", password="pass"
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "INSERT INTO recipes_recipe (author_id, name, image, "
+                "image_variants, text, cooking_time, pub_date, modified, "
+                "favorites_count, carts_count, popularity_score, "
+                "trending_score, fanned_out) "
+                "SELECT %s, 'рецепт ' || n, 'recipes/images/recipe.png', "
+                "'{}', 'описание', 10, now() - n * interval '1 second', "
+                "now(), 0, 0, 0, 0, true FROM generate_series(1, %s) AS n",
+                [cls.author.pk, cls.recipes],
+            )
+            cursor.execute("ANALYZE recipes_recipe")
+        # статистика ANALYZE не откатывается вместе с данными
+        cls.addClassCleanup(cls.analyze)
+
+    @classmethod
+    def analyze(cls):
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE recipes_recipe")
+
+    def get_list(self, url):
+        cache.clear()
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+
+    def test_list_count(self):
+        for url in (
+            "/api/recipes/",
+            f"/api/recipes/?author={self.author.pk}",
+        ):
+            with patch.object(
+                EstimatedCountPaginator, "exact_count_threshold", 10**12
+            ):
+                exact = median_time(lambda: self.get_list(url))
+            estimated = median_time(lambda: self.get_list(url))
+            print(
+                f"\n{url} on {self.recipes} recipes: "
+                f"exact count {exact:.1f} ms, estimate {estimated:.1f} ms"
+            )
+
+
+class ShoppingCartExportTest(RecipeDataMixin, APITestCase):
+    """Выгрузка списка покупок во всех форматах"""
+
+    url = "/api/recipes/download_shopping_cart/"
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        ShoppingListItem.objects.rebuild()
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(self.user)
+        totals = (
+            RecipeIngredientAmount.objects.filter(
+                recipe__shopping_cart__user=self.user
+            )
+            .values("ingredient__name", "ingredient__measurement_unit")
+            .annotate(total=Sum("amount"))
+            .order_by("ingredient__name")
+        )
+        self.rows = [
+            (
+                row["ingredient__name"],
+                str(row["total"]),
+                row["ingredient__measurement_unit"],
+            )
+            for row in totals
+        ]
+
+    def download(self, file_format):
+        response = self.client.get(f"{self.url}?file_format={file_format}")
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(
+            f"{self.user.username}_shopping_cart.{file_format}",
+            response["Content-Disposition"],
+        )
+        return b"".join(response.streaming_content)
+
+    def test_txt(self):
+        self.assertEqual(
+            self.download("txt").decode().splitlines(),
+            [f"{name}: {amount} {unit}" for name, amount, unit in self.rows],
+        )
+
+    def test_csv(self):
+        rows = list(csv.reader(self.download("csv").decode().splitlines()))
+        self.assertEqual(
+            rows[0], ["Ингредиент", "Количество", "Единица измерения"]
+        )
+        self.assertEqual([tuple(row) for row in rows[1:]], self.rows)
+
+    @skipUnless(
+        os.path.exists(settings.SHOPPING_CART_PDF_FONT),
+        "no font for the pdf export",
+    )
+    def test_pdf(self):
+        content = self.download("pdf")
+        self.assertTrue(content.startswith(b"%PDF"))
+
+    def test_unknown_format(self):
+        response = self.client.get(f"{self.url}?file_format=docx")
+        self.assertEqual(response.status_code, 400)
+
+
+def legacy_shopping_cart_response(user):
+    """Прежняя выгрузка: агрегация в запросе и ответ целиком в памяти"""
+    ingredients = (
+        RecipeIngredientAmount.objects.filter(recipe__shopping_cart__user=user)
+        .values(
+            ingr_name=F("ingredient__name"),
+            unit=F("ingredient__measurement_unit"),
+        )
+        .annotate(amount_sum=Sum("amount"))
+    )
+    shopping_list = list()
+    for ingr in ingredients:
+        shopping_list += (
+            f'{ingr["ingr_name"]}: {ingr["amount_sum"]} {ingr["unit"]}\n'
+        )
+    return HttpResponse(
+        shopping_list, content_type="text/plain; charset=utf-8"
+    )
+
+
+@skipUnless(BENCHMARK, "benchmark, run with BENCHMARK=1")
+class ShoppingCartBenchmark(APITestCase):
+    """Выгрузка большой корзины: прежний код и потоковая выгрузка"""
+
+    recipes = int(os.getenv("BENCHMARK_CART_RECIPES", default=5000))
+    ingredients = 2000
+    per_recipe = 10
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username="user", email="user@foodgram.ru", password="pass"
+        )
+        Ingredient.objects.bulk_create(
+            Ingredient(name=f"ингредиент {i:05}", measurement_unit="г")
+            for i in range(cls.ingredients)
+        )
+        Recipe.objects.bulk_create(
+            Recipe(
+                author=cls.user,
+                name=f"рецепт {i}",
+                image="recipes/images/recipe.png",
+                text="описание",
+                cooking_time=10,
+            )
+            for i in range(cls.recipes)
+        )
+        # bulk_create на SQLite не заполняет id
+        ingredients = list(Ingredient.objects.order_by("id"))
+        recipes = list(Recipe.objects.order_by("id"))
+        RecipeIngredientAmount.objects.bulk_create(
+            (
+                RecipeIngredientAmount(
+                    recipe=recipe,
+                    ingredient=ingredients[(i * 7 + j) % cls.ingredients],
+                    amount=j + 1,
+                )
+                for i, recipe in enumerate(recipes)
+                for j in range(cls.per_recipe)
+            ),
+            batch_size=5000,
+        )
+        ShoppingCart.objects.bulk_create(
+            (ShoppingCart(user=cls.user, recipe=recipe) for recipe in recipes),
+            batch_size=5000,
+        )
+        ShoppingListItem.objects.rebuild()
+
+    def test_txt_export(self):
+        def legacy():
+            return legacy_shopping_cart_response(self.user).content
+
+        def streaming():
+            response = shopping_cart_response(self.user, "txt")
+            for _ in response.streaming_content:
+                pass
+
+        for name, func in (("legacy", legacy), ("streaming", streaming)):
+            print(
+                f"\n{name} txt export of {self.recipes} recipes: "
+                f"{median_time(func):.1f} ms, "
+                f"peak {peak_memory(func):.0f} KB"
+            )
+
+
+class Base64ImageFieldTest(SimpleTestCase):
+    """Декодирование Base64 частями и ограничения размера картинки"""
+
+    def setUp(self):
+        self.png = make_png()
+        self.encoded = base64.b64encode(self.png).decode()
+
+    def decode(self, encoded):
+        return Base64ImageField().to_internal_value(
+            "data:image/png;base64," + encoded
+        )
+
+    def assert_fails(self, code, data):
+        with self.assertRaises(ValidationError) as context:
+            Base64ImageField().to_internal_value(data)
+        self.assertEqual(context.exception.get_codes(), [code])
+
+    def test_plain(self):
+        self.assertEqual(self.decode(self.encoded).read(), self.png)
+
+    def test_line_wrapped(self):
+        for newline in ("\n", "\r\n"):
+            with self.subTest(newline=newline):
+                encoded = wrap(self.encoded, newline=newline) + newline
+                self.assertEqual(self.decode(encoded).read(), self.png)
+
+    def test_remainder_carried_between_slices(self):
+        # части по 7 символов не кратны 4: хвост переходит в следующую
+        for width in (5, 64, 76):
+            with self.subTest(width=width), patch(
+                "api.utils.BASE64_CHUNK_SIZE", 7
+            ):
+                file = self.decode(wrap(self.encoded, width=width))
+                self.assertEqual(file.read(), self.png)
+
+    def test_size_without_whitespace(self):
+        self.assertEqual(
+            Base64ImageField.decoded_size(wrap(self.encoded) + "\n", 0),
+            len(self.png),
+        )
+
+    def test_invalid(self):
+        for encoded in (self.encoded[:-1], self.encoded[:-4] + "!!!!"):
+            with self.subTest(encoded=encoded[-8:]):
+                self.assert_fails(
+                    "invalid_base64", "data:image/png;base64," + encoded
+                )
+
+    def test_too_large(self):
+        with override_settings(RECIPE_IMAGE_MAX_BYTES=len(self.png) - 1):
+            self.assert_fails(
+                "too_large", "data:image/png;base64," + self.encoded
+            )
+            self.assert_fails(
+                "too_large",
+                SimpleUploadedFile("image.png", self.png, "image/png"),
+            )
+
+    def test_too_many_pixels(self):
+        with override_settings(RECIPE_IMAGE_MAX_PIXELS=40 * 30 - 1):
+            self.assert_fails(
+                "too_many_pixels", "data:image/png;base64," + self.encoded
+            )
+            self.assert_fails(
+                "too_many_pixels",
+                SimpleUploadedFile("image.png", self.png, "image/png"),
+            )
+
+
+class MultiPartRecipeTest(RecipeDataMixin, APITestCase):
+    """Рецепт с картинкой файлом в multipart/form-data"""
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(self.user)
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        settings_override = override_settings(MEDIA_ROOT=media_root.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def post(self, image):
+        data = {
+            "name": "борщ",
+            "text": "описание",
+            "cooking_time": 60,
+            "tags": [self.tags[0].pk],
+            "ingredients": [{"id": self.ingredients[0].pk, "amount": 300}],
+        }
+        return self.client.post(
+            "/api/recipes/",
+            {"data": json.dumps(data), "image": image},
+            format="multipart",
+        )
+
+    def test_create(self):
+        png = make_png()
+        response = self.post(
+            SimpleUploadedFile("borsch.png", png, "image/png")
+        )
+        self.assertEqual(response.status_code, 201, response.data)
+        recipe = Recipe.objects.get(pk=response.data["id"])
+        with recipe.image.open() as image:
+            self.assertEqual(image.read(), png)
+
+    def test_too_many_pixels(self):
+        with override_settings(RECIPE_IMAGE_MAX_PIXELS=100):
+            response = self.post(
+                SimpleUploadedFile("borsch.png", make_png(), "image/png")
+            )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("image", response.data)
+
+
+def legacy_decode(data):
+    """Прежнее декодирование: вся картинка в памяти в нескольких копиях"""
+    header, imgstr = data.split(";base64,")
+    ext = header.split("/")[-1]
+    return ContentFile(base64.b64decode(imgstr), name="temp." + ext)
+
+
+@skipUnless(BENCHMARK, "benchmark, run with BENCHMARK=1")
+class Base64ImageBenchmark(SimpleTestCase):
+    """Память при декодировании большой картинки из Base64"""
+
+    size = int(os.getenv("BENCHMARK_IMAGE_BYTES", default=8 * 1024 * 1024))
+
+    def test_decode_memory(self):
+        data = "data:image/png;base64," + wrap(
+            base64.b64encode(os.urandom(self.size)).decode()
+        )
+        # прежний декодер не принимал переносы строк
+        plain = data.replace("\r\n", "")
+        field = Base64ImageField()
+        for name, func in (
+            ("legacy", lambda: legacy_decode(plain)),
+            ("streaming", lambda: field.decode(data).close()),
+        ):
+            print(
+                f"\n{name} decode of {self.size // 1024} KB: "
+                f"{median_time(func):.1f} ms, "
+                f"peak {peak_memory(func):.0f} KB"
+            )
+
+
+@skipUnless(
+    os.getenv("TEST_REDIS_LOCATION"),
+    "set TEST_REDIS_LOCATION to a Redis server or a local stand-in",
+)
+@override_settings(
+    CACHES={
+        "default": {
+            "BACKEND": "django_redis.cache.RedisCache",
+            "LOCATION": os.getenv("TEST_REDIS_LOCATION"),
+            "KEY_PREFIX": "foodgram-test",
+        }
+    },
+    CACHE_VERSION_TIMEOUT=None,
+)
+class RedisCachedResponseTest(CachedResponseTest):
+    """Те же проверки кэша на сервере с протоколом Redis"""
@@ -1,9 +1,21 @@
 import base64
+import binascii
+from io import BytesIO
 
 import webcolors
-from django.core.files.base import ContentFile
+from django.conf import settings
+from django.core.files.uploadedfile import (
+    InMemoryUploadedFile,
+    TemporaryUploadedFile,
+)
+from PIL import Image
 from rest_framework import serializers
 
+BASE64_PREFIX = ";base64,"
+BASE64_CHUNK_SIZE = 64 * 1024
+BASE64_WHITESPACE = " \t\n\r\f\v"
+STRIP_WHITESPACE = str.maketrans("", "", BASE64_WHITESPACE)
+
 
 class Hex2NameColor(serializers.Field):
     """Hex-color в читабельный вид"""
@@ -18,12 +30,111 @@ class Hex2NameColor(serializers.Field):
             raise serializers.ValidationError("Для этого цвета нет имени")
 
 
+class BulkPrimaryKeyRelatedField(serializers.ListField):
+    """Список первичных ключей, объекты читаются одним запросом `in_bulk`"""
+
+    default_error_messages = {
+        "does_not_exist": "Объекты с id {pk_values} не существуют.",
+    }
+
+    def __init__(self, queryset, **kwargs):
+        self.queryset = queryset
+        super().__init__(child=serializers.IntegerField(), **kwargs)
+
+    def to_internal_value(self, data):
+        pk_values = list(dict.fromkeys(super().to_internal_value(data)))
+        objects = self.queryset.in_bulk(pk_values)
+        missing = [pk for pk in pk_values if pk not in objects]
+        if missing:
+            self.fail("does_not_exist", pk_values=missing)
+        return [objects[pk] for pk in pk_values]
+
+    def to_representation(self, value):
+        if hasattr(value, "all"):
+            value = value.all()
+        return [item.pk for item in value]
+
+
 class Base64ImageField(serializers.ImageField):
-    """Декодер картринки из формата Base64"""
+    """Декодер картринки из формата Base64
+
+    Строка декодируется частями в файл: в памяти, если картинка меньше
+    `FILE_UPLOAD_MAX_MEMORY_SIZE`, иначе во временный файл на диске.
+    Размер в байтах проверяется по длине строки до декодирования, размер
+    в пикселях — по заголовку картинки до распаковки. Файл из multipart
+    запроса проверяется так же и передается дальше без копирования.
+    """
+
+    default_error_messages = {
+        "invalid_base64": "Некорректная картинка в формате Base64.",
+        "too_large": "Размер картинки больше {max_bytes} байт.",
+        "too_many_pixels": "Картинка больше {max_pixels} пикселей.",
+    }
 
     def to_internal_value(self, data):
         if isinstance(data, str) and data.startswith("data:image"):
-            format, imgstr = data.split(";base64,")
-            ext = format.split("/")[-1]
-            data = ContentFile(base64.b64decode(imgstr), name="temp." + ext)
+            data = self.decode(data)
+        elif getattr(data, "size", 0) > settings.RECIPE_IMAGE_MAX_BYTES:
+            self.fail("too_large", max_bytes=settings.RECIPE_IMAGE_MAX_BYTES)
+        self.check_pixels(data)
         return super().to_internal_value(data)
+
+    def decode(self, data):
+        start = data.find(BASE64_PREFIX)
+        if start == -1:
+            self.fail("invalid_base64")
+        content_type = data[:start].partition(":")[2]
+        name = "temp." + content_type.split("/")[-1]
+        start += len(BASE64_PREFIX)
+        size = self.decoded_size(data, start)
+        if size > settings.RECIPE_IMAGE_MAX_BYTES:
+            self.fail("too_large", max_bytes=settings.RECIPE_IMAGE_MAX_BYTES)
+        if size > settings.FILE_UPLOAD_MAX_MEMORY_SIZE:
+            file = TemporaryUploadedFile(name, content_type, size, None)
+        else:
+            file = InMemoryUploadedFile(
+                BytesIO(), None, name, content_type, size, None
+            )
+        # строка может быть разбита на строки: пробельные символы
+        # выбрасываются, а хвост части, не кратный 4, переносится дальше
+        rest = ""
+        try:
+            for offset in range(start, len(data), BASE64_CHUNK_SIZE):
+                end = offset + BASE64_CHUNK_SIZE
+                chunk = rest + data[offset:end].translate(STRIP_WHITESPACE)
+                usable = len(chunk) - len(chunk) % 4
+                file.write(base64.b64decode(chunk[:usable], validate=True))
+                rest = chunk[usable:]
+            if rest:
+                raise ValueError("incomplete base64")
+        except (binascii.Error, ValueError):
+            file.close()
+            self.fail("invalid_base64")
+        file.seek(0)
+        return file
+
+    @staticmethod
+    def decoded_size(data, start):
+        """Размер картинки по длине строки без пробельных символов"""
+        whitespace = sum(data.count(char, start) for char in BASE64_WHITESPACE)
+        end = len(data)
+        while end > start and data[end - 1] in BASE64_WHITESPACE:
+            end -= 1
+        padding = data.count("=", max(start, end - 2), end)
+        return (len(data) - start - whitespace) * 3 // 4 - padding
+
+    def check_pixels(self, data):
+        if not hasattr(data, "seek"):
+            return
+        try:
+            with Image.open(data) as image:
+                pixels = image.width * image.height
+        except Exception:
+            # не картинка: ошибку вернет проверка ImageField
+            return
+        finally:
+            data.seek(0)
+        if pixels > settings.RECIPE_IMAGE_MAX_PIXELS:
+            self.fail(
+                "too_many_pixels", max_pixels=settings.RECIPE_IMAGE_MAX_PIXELS
+            )
@@ -42,21 +42,27 @@ class RecipeIngredientsAmountValidator:
 
 
 class RecipeIngredientsValidator:
-    """Проверка полей ингредиентов в рецептах"""
+    """Проверка что ингредиенты в рецепте не повторяются
+
+    Повторы ищутся за один проход по множеству уже встреченных id,
+    ошибка возвращается на месте каждого повторного ингредиента.
+    """
 
     def __init__(self, ingredients):
         self.ingredients = ingredients
 
     def __call__(self, data):
-        ingr_set = list()
-        for ingr in data["recipe_ingredient_amount"]:
-            if ingr.get("amount") <= 0:
-                message = "Ингредиентов должно быть больше 0."
-                raise ValidationError(message)
-            pk = ingr.get("ingredient")
-            ingr_set.append(pk)
-            if ingr_set.count(pk) > 1:
-                raise ValidationError("Не должено быть повторений.")
+        seen = set()
+        errors = []
+        for ingr in data.get("recipe_ingredient_amount", ()):
+            pk = ingr["ingredient_id"]
+            if pk in seen:
+                errors.append({"id": ["Не должено быть повторений."]})
+            else:
+                seen.add(pk)
+                errors.append({})
+        if any(errors):
+            raise ValidationError({self.ingredients: errors})
         return data
 
 
@@ -67,7 +73,7 @@ class RecipeCookingTimeValidator:
         self.cooking_time = cooking_time
 
     def __call__(self, data):
-        if data["cooking_time"] <= 0:
+        if data.get("cooking_time", 1) <= 0:
             message = "Время готовки должно быть больше 0."
             raise ValidationError(message)
         return data
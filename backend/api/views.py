@@ -1,18 +1,36 @@
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.db.models import F, Sum
-from django.http.response import HttpResponse
+from django.db import transaction
+from django.db.models import (
+    BooleanField,
+    Exists,
+    OuterRef,
+    Prefetch,
+    Subquery,
+    Value,
+)
 from django_filters.rest_framework import DjangoFilterBackend
 from djoser.views import UserViewSet
 from rest_framework import status
 from rest_framework.decorators import action
 from rest_framework.generics import get_object_or_404
+from rest_framework.parsers import JSONParser
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
+from rest_framework.serializers import ValidationError
 from rest_framework.viewsets import ModelViewSet, ReadOnlyModelViewSet
 
-from .filters import IngredientSearchFilter, RecipeFilter
-from .pagination import ApiPagination
+from .cache import CachedResponseMixin, cache_response
+from .feed import Feed, backfill_feed, drop_feed
+from .filters import RecipeFilter
+from .pagination import ApiPagination, FeedPagination
+from .parsers import MultiPartJSONParser
 from .permissions import IsAuthorOrReadOnly
+from .search import (
+    ingredient_index,
+    recipe_ingredient_index,
+    search_ingredients_fuzzy,
+)
 from .serializers import (
     CustomUserSerializer,
     IngredientSerializer,
@@ -21,15 +39,17 @@ from .serializers import (
     SubscribeSerializer,
     SubscriptionsSerializer,
     TagSerializer,
+    get_recipes_limit,
 )
-from cart.models import ShoppingCart
+from .shopping_cart import SHOPPING_CART_FORMATS, shopping_cart_response
+from cart.models import ShoppingCart, ShoppingListItem
 from recipes.models import (
     Favorite,
     Follow,
     Ingredient,
     Recipe,
-    RecipeIngredientAmount,
     Tag,
+    change_counter,
 )
 
 User = get_user_model()
@@ -53,6 +73,7 @@ class CustomUserViewSet(UserViewSet):
         user = self.request.user
         author = self.get_object()
         if request.method == "POST":
+            get_recipes_limit(request)
             data = {
                 "user": user.id,
                 "author": author.id,
@@ -61,14 +82,20 @@ class CustomUserViewSet(UserViewSet):
                 data=data, context={"request": request}
             )
             serializer.is_valid(raise_exception=True)
-            serializer.save()
+            with transaction.atomic():
+                serializer.save()
+                change_counter(User, author.pk, "followers_count", 1)
+                backfill_feed(user, author)
             serializer = SubscriptionsSerializer(
                 author, context={"request": request}
             )
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         else:
             subscribe = get_object_or_404(Follow, user=user, author=author)
-            subscribe.delete()
+            with transaction.atomic():
+                subscribe.delete()
+                change_counter(User, author.pk, "followers_count", -1)
+                drop_feed(user, author)
             return Response(status=status.HTTP_204_NO_CONTENT)
 
     @action(
@@ -78,7 +105,26 @@ class CustomUserViewSet(UserViewSet):
     )
     def subscriptions(self, request):
         user = self.request.user
-        queryset = User.objects.filter(follow_author__user=user)
+        recipes = Recipe.objects.all()
+        limit = get_recipes_limit(request)
+        if limit is not None:
+            recipes = recipes.filter(
+                pk__in=Subquery(
+                    Recipe.objects.filter(author=OuterRef("author")).values(
+                        "pk"
+                    )[:limit]
+                )
+            )
+        queryset = (
+            User.objects.filter(follow_author__user=user)
+            .annotate(is_subscribed=Value(True, output_field=BooleanField()))
+            .prefetch_related(
+                Prefetch(
+                    "recipes", queryset=recipes, to_attr="prefetched_recipes"
+                )
+            )
+            .order_by("id")
+        )
         paginated_follow = self.paginate_queryset(queryset=queryset)
         serializer = SubscriptionsSerializer(
             paginated_follow, many=True, context={"request": request}
@@ -90,14 +136,57 @@ class RecipeViewSet(ModelViewSet):
     """Вьюсет для рецептов"""
 
     permission_classes = [IsAuthorOrReadOnly]
+    parser_classes = [JSONParser, MultiPartJSONParser]
     queryset = Recipe.objects.all()
     serializer_class = RecipeSerializer
     pagination_class = ApiPagination
     filter_backends = [DjangoFilterBackend]
     filterset_class = RecipeFilter
+    recipe_counters = {
+        Favorite: "favorites_count",
+        ShoppingCart: "carts_count",
+    }
+
+    def get_queryset(self):
+        """Лента с постоянным числом запросов независимо от размера страницы"""
+        queryset = super().get_queryset().defer("search_vector")
+        if self.action not in ("list", "retrieve", "feed", "by_ingredients"):
+            return queryset
+        user = self.request.user
+        if not user.is_authenticated:
+            false = Value(False, output_field=BooleanField())
+            return queryset.annotate(
+                is_favorited=false,
+                is_in_shopping_cart=false,
+                is_author_subscribed=false,
+            )
+        return queryset.annotate(
+            is_favorited=Exists(
+                Favorite.objects.filter(user=user, recipe=OuterRef("pk"))
+            ),
+            is_in_shopping_cart=Exists(
+                ShoppingCart.objects.filter(user=user, recipe=OuterRef("pk"))
+            ),
+            is_author_subscribed=Exists(
+                Follow.objects.filter(user=user, author=OuterRef("author"))
+            ),
+        )
 
+    @transaction.atomic
     def perform_create(self, serializer):
-        return serializer.save(author=self.request.user)
+        recipe = serializer.save(author=self.request.user)
+        change_counter(User, recipe.author_id, "recipes_count", 1)
+        return recipe
+
+    @transaction.atomic
+    def perform_update(self, serializer):
+        serializer.save()
+
+    @transaction.atomic
+    def perform_destroy(self, instance):
+        ShoppingListItem.objects.discard_recipe(instance)
+        instance.delete()
+        change_counter(User, instance.author_id, "recipes_count", -1)
 
     def _do_post_delete(self, request, model):
         user = self.request.user
@@ -108,10 +197,16 @@ class RecipeViewSet(ModelViewSet):
                 recipe=recipe,
             ).exists():
                 return Response(status=status.HTTP_400_BAD_REQUEST)
-            model.objects.create(
-                user=user,
-                recipe=recipe,
-            )
+            with transaction.atomic():
+                model.objects.create(
+                    user=user,
+                    recipe=recipe,
+                )
+                change_counter(
+                    Recipe, recipe.pk, self.recipe_counters[model], 1
+                )
+                if model is ShoppingCart:
+                    ShoppingListItem.objects.add_recipe(user, recipe)
             serializer = RepresentationRecipeSerializer(
                 recipe,
                 context={"request": request},
@@ -120,7 +215,13 @@ class RecipeViewSet(ModelViewSet):
 
         else:
             item = get_object_or_404(model, user=user, recipe=recipe)
-            item.delete()
+            with transaction.atomic():
+                item.delete()
+                change_counter(
+                    Recipe, recipe.pk, self.recipe_counters[model], -1
+                )
+                if model is ShoppingCart:
+                    ShoppingListItem.objects.remove_recipe(user, recipe)
             return Response(status=status.HTTP_204_NO_CONTENT)
 
     @action(
@@ -140,35 +241,63 @@ class RecipeViewSet(ModelViewSet):
         return self._do_post_delete(request, ShoppingCart)
 
     @action(
-        methods=["get"],
         detail=False,
         permission_classes=[IsAuthenticated],
+        pagination_class=FeedPagination,
     )
-    def download_shopping_cart(self, request):
-        user = self.request.user
-        filename = f"{user.username}_shopping_cart.txt"
+    def feed(self, request):
+        keys = self.paginate_queryset(Feed(request.user))
+        recipes = self.get_queryset().in_bulk(
+            [recipe_id for _, recipe_id in keys]
+        )
+        serializer = self.get_serializer(
+            [recipes[pk] for _, pk in keys if pk in recipes], many=True
+        )
+        return self.get_paginated_response(serializer.data)
 
-        ingredients = (
-            RecipeIngredientAmount.objects.filter(
-                recipe__shopping_cart__user=user
-            )
-            .values(
-                ingr_name=F("ingredient__name"),
-                unit=F("ingredient__measurement_unit"),
+    @action(detail=False)
+    def by_ingredients(self, request):
+        try:
+            ingredient_ids = [
+                int(value)
+                for value in request.query_params.getlist("ingredients")
+            ]
+            max_missing = request.query_params.get("max_missing")
+            if max_missing is not None:
+                max_missing = int(max_missing)
+        except ValueError:
+            raise ValidationError(
+                "ingredients и max_missing должны быть целыми числами."
             )
-            .annotate(amount_sum=Sum("amount"))
+        if not ingredient_ids:
+            raise ValidationError("Укажите хотя бы один ингредиент.")
+        ranked = recipe_ingredient_index.search(ingredient_ids, max_missing)
+        page = self.paginate_queryset(ranked)
+        recipes = self.get_queryset().in_bulk(
+            [recipe_id for recipe_id, _, _ in page]
         )
-        shopping_list = list()
-        for ingr in ingredients:
-            shopping_list += (
-                f'{ingr["ingr_name"]}: {ingr["amount_sum"]} {ingr["unit"]}\n'
-            )
-
-        response = HttpResponse(
-            shopping_list, content_type="text/plain; charset=utf-8"
+        page = [row for row in page if row[0] in recipes]
+        serializer = self.get_serializer(
+            [recipes[recipe_id] for recipe_id, _, _ in page], many=True
         )
-        response["Content-Disposition"] = f"attachment; filename={filename}"
-        return response
+        data = serializer.data
+        for item, (_, matched, missing) in zip(data, page):
+            item["ingredients_matched"] = matched
+            item["ingredients_missing"] = missing
+        return self.get_paginated_response(data)
+
+    @action(
+        methods=["get"],
+        detail=False,
+        permission_classes=[IsAuthenticated],
+    )
+    def download_shopping_cart(self, request):
+        file_format = request.query_params.get("file_format", "txt")
+        if file_format not in SHOPPING_CART_FORMATS:
+            raise ValidationError(
+                "Доступные форматы: " + ", ".join(SHOPPING_CART_FORMATS)
+            )
+        return shopping_cart_response(self.request.user, file_format)
 
 
 class IngredientViewSet(ReadOnlyModelViewSet):
@@ -178,14 +307,34 @@ class IngredientViewSet(ReadOnlyModelViewSet):
     queryset = Ingredient.objects.all()
     pagination_class = None
     serializer_class = IngredientSerializer
-    filter_backends = [IngredientSearchFilter]
-    search_fields = ["^name"]
+    cache_namespace = "ingredients"
+    cache_vary_on_user = False
+    cache_timeout = settings.CACHE_LONG_TIMEOUT
+    search_limit = 50
+
+    @cache_response
+    def list(self, request, *args, **kwargs):
+        name = request.query_params.get("name")
+        if not name:
+            return super().list(request, *args, **kwargs)
+        mode = request.query_params.get("mode", "prefix")
+        if mode == "prefix":
+            return Response(ingredient_index.search(name, self.search_limit))
+        if mode == "fuzzy":
+            return Response(search_ingredients_fuzzy(name, self.search_limit))
+        raise ValidationError("Доступные режимы поиска: prefix, fuzzy")
+
+    @cache_response
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
 
 
-class TagViewSet(ReadOnlyModelViewSet):
+class TagViewSet(CachedResponseMixin, ReadOnlyModelViewSet):
     """Вьюсет для тэгов"""
 
     queryset = Tag.objects.all()
     permission_classes = [AllowAny]
     pagination_class = None
     serializer_class = TagSerializer
+    cache_namespace = "tags"
+    cache_timeout = settings.CACHE_LONG_TIMEOUT
@@ -0,0 +1,19 @@
+# Generated by Django 3.2.15 on 2026-10-18 16:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("cart", "0004_shoppinglistitem"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="shoppingcart",
+            index=models.Index(
+                fields=["user", "-pub_date"], name="cart_user_pub_date_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.15 on 2026-10-18 16:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("cart", "0005_hot_path_indexes"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="shoppingcart",
+            name="pub_date",
+            field=models.DateTimeField(auto_now_add=True, db_index=True),
+        ),
+    ]
@@ -1,6 +1,9 @@
-from django.db import models
+from itertools import islice
 
-from recipes.models import Recipe
+from django.db import models, transaction
+from django.db.models import Case, F, IntegerField, Sum, Value, When
+
+from recipes.models import Ingredient, Recipe, RecipeIngredientAmount
 from users.models import User
 
 
@@ -19,7 +22,7 @@ class ShoppingCart(models.Model):
         related_name="shopping_cart",
         verbose_name="Рецепт",
     )
-    pub_date = models.DateTimeField(auto_now_add=True)
+    pub_date = models.DateTimeField(auto_now_add=True, db_index=True)
 
     class Meta:
         constraints = [
@@ -27,6 +30,163 @@ class ShoppingCart(models.Model):
                 fields=["user", "recipe"], name="unique_shopping_cart"
             )
         ]
+        indexes = [
+            models.Index(
+                fields=["user", "-pub_date"],
+                name="cart_user_pub_date_idx",
+            ),
+        ]
         ordering = ("-pub_date",)
         verbose_name = "Список покупок"
         verbose_name_plural = "Списки покупок"
+
+
+def get_recipe_amounts(recipe):
+    """Количество каждого ингредиента рецепта"""
+    return dict(
+        RecipeIngredientAmount.objects.filter(recipe=recipe).values_list(
+            "ingredient_id", "amount"
+        )
+    )
+
+
+class ShoppingListItemManager(models.Manager):
+    """Инкрементальное обновление сумм ингредиентов списков покупок"""
+
+    def apply_delta(self, user_ids, deltas):
+        deltas = {
+            ingredient_id: delta
+            for ingredient_id, delta in deltas.items()
+            if delta
+        }
+        if not deltas:
+            return
+        user_ids = list(user_ids)
+        if not user_ids:
+            return
+        with transaction.atomic():
+            self.bulk_create(
+                [
+                    self.model(user_id=user_id, ingredient_id=ingredient_id)
+                    for user_id in user_ids
+                    for ingredient_id, delta in deltas.items()
+                    if delta > 0
+                ],
+                ignore_conflicts=True,
+            )
+            items = self.filter(user_id__in=user_ids, ingredient_id__in=deltas)
+            items.update(
+                amount=F("amount")
+                + Case(
+                    *[
+                        When(ingredient_id=ingredient_id, then=Value(delta))
+                        for ingredient_id, delta in deltas.items()
+                    ],
+                    default=Value(0),
+                    output_field=IntegerField(),
+                )
+            )
+            items.filter(amount__lte=0).delete()
+
+    def add_recipe(self, user, recipe):
+        self.apply_delta([user.id], get_recipe_amounts(recipe))
+
+    def remove_recipe(self, user, recipe):
+        self.apply_delta(
+            [user.id],
+            {
+                ingredient_id: -amount
+                for ingredient_id, amount in get_recipe_amounts(recipe).items()
+            },
+        )
+
+    def discard_recipe(self, recipe):
+        """Вычитание рецепта из списков всех пользователей перед удалением"""
+        self.apply_delta(
+            ShoppingCart.objects.filter(recipe=recipe).values_list(
+                "user_id", flat=True
+            ),
+            {
+                ingredient_id: -amount
+                for ingredient_id, amount in get_recipe_amounts(recipe).items()
+            },
+        )
+
+    def update_recipe(self, recipe, old_amounts, new_amounts=None):
+        """Перенос изменений ингредиентов рецепта в списки покупок"""
+        if new_amounts is None:
+            new_amounts = get_recipe_amounts(recipe)
+        self.apply_delta(
+            ShoppingCart.objects.filter(recipe=recipe).values_list(
+                "user_id", flat=True
+            ),
+            {
+                ingredient_id: new_amounts.get(ingredient_id, 0)
+                - old_amounts.get(ingredient_id, 0)
+                for ingredient_id in new_amounts.keys() | old_amounts.keys()
+            },
+        )
+
+    def expected_totals(self):
+        """Суммы ингредиентов, посчитанные по содержимому корзин"""
+        return (
+            RecipeIngredientAmount.objects.filter(
+                recipe__shopping_cart__isnull=False
+            )
+            .values(
+                user_id=F("recipe__shopping_cart__user"),
+                ingr_id=F("ingredient"),
+            )
+            .annotate(total=Sum("amount"))
+            .order_by()
+        )
+
+    def rebuild(self, batch_size=1000):
+        with transaction.atomic():
+            self.all().delete()
+            rows = self.expected_totals().iterator(chunk_size=batch_size)
+            while True:
+                batch = [
+                    self.model(
+                        user_id=row["user_id"],
+                        ingredient_id=row["ingr_id"],
+                        amount=row["total"],
+                    )
+                    for row in islice(rows, batch_size)
+                ]
+                if not batch:
+                    break
+                self.bulk_create(batch)
+
+
+class ShoppingListItem(models.Model):
+    """Модель сводного списка покупок пользователя"""
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name="shopping_list",
+        verbose_name="Пользователь",
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        related_name="shopping_list",
+        verbose_name="Ингредиент",
+    )
+    amount = models.IntegerField(
+        verbose_name="Количество",
+        default=0,
+    )
+
+    objects = ShoppingListItemManager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "ingredient"],
+                name="unique_shopping_list_item",
+            )
+        ]
+        verbose_name = "Ингредиент списка покупок"
+        verbose_name_plural = "Сводные списки покупок"
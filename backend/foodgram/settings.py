@@ -1,5 +1,6 @@
 import os
 
+from django.core.exceptions import ImproperlyConfigured
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -19,6 +20,7 @@ INSTALLED_APPS = [
     "django.contrib.sessions",
     "django.contrib.messages",
     "django.contrib.staticfiles",
+    "django.contrib.postgres",
     "rest_framework",
     "rest_framework.authtoken",
     "corsheaders",
@@ -89,6 +91,49 @@ DATABASES = {
     }
 }
 
+CACHE_BACKENDS = {
+    "locmem": (
+        "django.core.cache.backends.locmem.LocMemCache",
+        "foodgram",
+    ),
+    "file": (
+        "django.core.cache.backends.filebased.FileBasedCache",
+        os.path.join(BASE_DIR, "cache"),
+    ),
+    "redis": (
+        "django_redis.cache.RedisCache",
+        "redis://127.0.0.1:6379/1",
+    ),
+}
+CACHE_BACKEND_NAME = os.getenv("CACHE_BACKEND", default="locmem")
+if CACHE_BACKEND_NAME not in CACHE_BACKENDS:
+    raise ImproperlyConfigured(
+        f"Unknown CACHE_BACKEND {CACHE_BACKEND_NAME!r}, "
+        f"choose one of: {', '.join(CACHE_BACKENDS)}"
+    )
+CACHE_BACKEND, CACHE_LOCATION = CACHE_BACKENDS[CACHE_BACKEND_NAME]
+# У locmem в каждом процессе свой кэш: сброс записей и версий из другого
+# воркера gunicorn или из команды manage.py до него не доходит. Поэтому
+# с locmem записи и версии живут недолго, а в продакшене нужен redis.
+CACHE_LOCAL = CACHE_BACKEND_NAME == "locmem"
+CACHE_LONG_TIMEOUT = int(
+    os.getenv(
+        "CACHE_LONG_TIMEOUT", default=60 if CACHE_LOCAL else 60 * 60 * 24
+    )
+)
+CACHE_VERSION_TIMEOUT = CACHE_LONG_TIMEOUT if CACHE_LOCAL else None
+
+CACHES = {
+    "default": {
+        "BACKEND": CACHE_BACKEND,
+        "LOCATION": os.getenv("CACHE_LOCATION", default=CACHE_LOCATION),
+        "TIMEOUT": int(
+            os.getenv("CACHE_TIMEOUT", default=60 if CACHE_LOCAL else 300)
+        ),
+        "KEY_PREFIX": os.getenv("CACHE_KEY_PREFIX", default="foodgram"),
+    }
+}
+
 
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -124,6 +169,26 @@ STATIC_ROOT = os.path.join(BASE_DIR, "static")
 MEDIA_URL = "/media/"
 MEDIA_ROOT = os.path.join(BASE_DIR, "media")
 
+RECIPE_IMAGE_MAX_BYTES = int(
+    os.getenv("RECIPE_IMAGE_MAX_BYTES", default=10 * 1024 * 1024)
+)
+RECIPE_IMAGE_MAX_PIXELS = int(
+    os.getenv("RECIPE_IMAGE_MAX_PIXELS", default=40 * 1000 * 1000)
+)
+RECIPE_IMAGE_VARIANTS = {
+    "card": 480,
+    "detail": 960,
+    "retina": 1920,
+}
+RECIPE_IMAGE_WORKERS = int(os.getenv("RECIPE_IMAGE_WORKERS", default=2))
+
+FEED_FANOUT_LIMIT = int(os.getenv("FEED_FANOUT_LIMIT", default=1000))
+
+SHOPPING_CART_PDF_FONT = os.getenv(
+    "SHOPPING_CART_PDF_FONT",
+    default="/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf",
+)
+
 
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from api.images import build_image_variants
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = "build resized WebP/JPEG copies of recipe images"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--all",
+            action="store_true",
+            help="rebuild copies of every recipe, not only missing ones",
+        )
+
+    def handle(self, *args, **kwargs):
+        recipes = Recipe.objects.exclude(image="")
+        if not kwargs["all"]:
+            recipes = recipes.filter(image_variants={})
+        built = 0
+        for recipe_id, image_name in recipes.values_list("id", "image"):
+            build_image_variants(recipe_id, image_name)
+            built += 1
+            if kwargs["verbosity"] > 1:
+                self.stdout.write(f"built {image_name}")
+        self.stdout.write(f"image variants built for {built} recipes")
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+
+from api.cache import get_stats
+from api.urls import router
+
+
+class Command(BaseCommand):
+    help = "show cache hits and misses per namespace"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "namespaces",
+            nargs="*",
+            help="namespaces to show, by default those of the API viewsets",
+        )
+
+    def handle(self, *args, **kwargs):
+        namespaces = kwargs["namespaces"] or [
+            viewset.cache_namespace
+            for _, viewset, _ in router.registry
+            if getattr(viewset, "cache_namespace", None)
+        ] + ["recipes"]
+        for namespace in namespaces:
+            hits, misses = get_stats(namespace)
+            total = hits + misses
+            self.stdout.write(
+                "{}: hits {}, misses {}, hit ratio {:.1%}".format(
+                    namespace, hits, misses, hits / total if total else 0
+                )
+            )
@@ -0,0 +1,132 @@
+import json
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext, override_settings
+from rest_framework.test import APIClient
+
+from recipes.models import Tag
+
+User = get_user_model()
+
+RECIPE_TABLES = {
+    "recipes_recipe",
+    "recipes_favorite",
+    "cart_shoppingcart",
+    "recipes_follow",
+    "users_user",
+    "recipes_tag",
+    "recipes_recipetag",
+    "recipes_recipeingredientamount",
+    "recipes_ingredient",
+}
+FEED_TABLES = RECIPE_TABLES | {"recipes_feedentry"}
+SUBSCRIPTION_TABLES = {"users_user", "recipes_follow", "recipes_recipe"}
+SHOPPING_LIST_TABLES = {"cart_shoppinglistitem", "recipes_ingredient"}
+# справочники, которые читаются целиком для выбора в фильтрах
+FULL_SCAN_TABLES = {"recipes_tag"}
+
+
+class Command(BaseCommand):
+    help = (
+        "run EXPLAIN for the SQL of the hot API endpoints and fail on "
+        "sequential scans or joins of unexpected tables (PostgreSQL only)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--user",
+            help="username to send requests as, by default the first user",
+        )
+
+    def get_endpoints(self, user):
+        tag = Tag.objects.values_list("slug", flat=True).first()
+        endpoints = [
+            ("/api/recipes/", RECIPE_TABLES),
+            ("/api/recipes/?cursor=", RECIPE_TABLES),
+            ("/api/recipes/?ordering=popular&cursor=", RECIPE_TABLES),
+            ("/api/recipes/?ordering=trending", RECIPE_TABLES),
+            ("/api/recipes/?search=капуста", RECIPE_TABLES),
+            ("/api/recipes/?is_favorited=1", RECIPE_TABLES),
+            ("/api/recipes/?is_in_shopping_cart=1", RECIPE_TABLES),
+            (f"/api/recipes/?author={user.pk}", RECIPE_TABLES),
+            ("/api/users/subscriptions/?recipes_limit=3", SUBSCRIPTION_TABLES),
+            ("/api/recipes/feed/", FEED_TABLES),
+            ("/api/recipes/download_shopping_cart/", SHOPPING_LIST_TABLES),
+        ]
+        if tag is not None:
+            endpoints.append((f"/api/recipes/?tags={tag}", RECIPE_TABLES))
+        return endpoints
+
+    def capture(self, client, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get(url)
+            if response.streaming:
+                b"".join(response.streaming_content)
+        if response.status_code != 200:
+            raise CommandError(f"{url}: status {response.status_code}")
+        return [
+            query["sql"]
+            for query in queries.captured_queries
+            if query["sql"].lstrip().upper().startswith("SELECT")
+        ]
+
+    def explain(self, sql):
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute("SET LOCAL enable_seqscan = off")
+            cursor.execute("EXPLAIN (FORMAT JSON) " + sql)
+            plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return plan[0]["Plan"]
+
+    def walk(self, node):
+        yield node
+        for child in node.get("Plans", ()):
+            yield from self.walk(child)
+
+    def check_endpoint(self, url, tables):
+        problems = []
+        for sql in self.capture(self.client, url):
+            for node in self.walk(self.explain(sql)):
+                relation = node.get("Relation Name")
+                if relation is None:
+                    continue
+                if (
+                    node["Node Type"] == "Seq Scan"
+                    and relation not in FULL_SCAN_TABLES
+                ):
+                    problems.append(f"{url}: seq scan on {relation}")
+                elif relation not in tables:
+                    problems.append(f"{url}: unexpected {relation}")
+        return problems
+
+    def handle(self, *args, **kwargs):
+        if connection.vendor != "postgresql":
+            raise CommandError("query plans can be checked on PostgreSQL only")
+        users = User.objects.order_by("pk")
+        if kwargs["user"]:
+            users = users.filter(username=kwargs["user"])
+        user = users.first()
+        if user is None:
+            raise CommandError("no user to send requests as")
+        self.client = APIClient()
+        self.client.force_authenticate(user)
+
+        problems = []
+        dummy_cache = {
+            "default": {
+                "BACKEND": "django.core.cache.backends.dummy.DummyCache"
+            }
+        }
+        with override_settings(CACHES=dummy_cache):
+            for url, tables in self.get_endpoints(user):
+                problems.extend(self.check_endpoint(url, tables))
+                if kwargs["verbosity"] > 1:
+                    self.stdout.write(f"checked {url}")
+        for problem in problems:
+            self.stderr.write(problem)
+        if problems:
+            raise CommandError(f"{len(problems)} query plan problems found")
+        self.stdout.write("query plans use indexes only")
@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from cart.models import ShoppingListItem
+
+
+class Command(BaseCommand):
+    help = "compare materialized shopping list totals with shopping carts"
+
+    def handle(self, *args, **kwargs):
+        expected = {
+            (row["user_id"], row["ingr_id"]): row["total"]
+            for row in ShoppingListItem.objects.expected_totals().iterator()
+        }
+        stored = {
+            (user_id, ingredient_id): amount
+            for user_id, ingredient_id, amount in (
+                ShoppingListItem.objects.values_list(
+                    "user_id", "ingredient_id", "amount"
+                ).iterator()
+            )
+        }
+        mismatches = 0
+        for key in expected.keys() | stored.keys():
+            if expected.get(key, 0) != stored.get(key, 0):
+                mismatches += 1
+                self.stderr.write(
+                    "user {} ingredient {}: expected {}, stored {}".format(
+                        *key, expected.get(key, 0), stored.get(key, 0)
+                    )
+                )
+        if mismatches:
+            raise CommandError(
+                "{} inconsistent rows, run rebuildshoppinglists".format(
+                    mismatches
+                )
+            )
+        self.stdout.write("shopping lists are consistent")
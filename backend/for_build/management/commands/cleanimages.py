@@ -0,0 +1,66 @@
+import posixpath
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from api.images import variant_files
+from recipes.models import Recipe
+
+BATCH_SIZE = 1000
+
+
+class Command(BaseCommand):
+    help = "delete recipe images and image copies no recipe refers to"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--min-age",
+            type=int,
+            default=60,
+            help="keep files modified less than this many minutes ago",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="only list files that would be deleted",
+        )
+
+    def walk(self, storage, directory):
+        directories, files = storage.listdir(directory)
+        for name in files:
+            yield posixpath.join(directory, name)
+        for name in directories:
+            yield from self.walk(storage, posixpath.join(directory, name))
+
+    def handle(self, *args, **kwargs):
+        field = Recipe._meta.get_field("image")
+        storage = field.storage
+        root = field.upload_to.rstrip("/")
+        if not storage.exists(root):
+            self.stdout.write("no recipe images found")
+            return
+        referenced = set()
+        rows = Recipe.objects.values_list("image", "image_variants")
+        for image, variants in rows.iterator(chunk_size=BATCH_SIZE):
+            referenced.add(image)
+            referenced.update(variant_files(variants))
+        # свежие файлы могут принадлежать еще не сохраненным рецептам
+        border = timezone.now() - timedelta(minutes=kwargs["min_age"])
+        deleted = freed = 0
+        for name in self.walk(storage, root):
+            if name in referenced or storage.get_modified_time(name) > border:
+                continue
+            deleted += 1
+            freed += storage.size(name)
+            if kwargs["verbosity"] > 1 or kwargs["dry_run"]:
+                self.stdout.write(name)
+            if not kwargs["dry_run"]:
+                storage.delete(name)
+        self.stdout.write(
+            "{} {} files, {:.1f} MB".format(
+                "would delete" if kwargs["dry_run"] else "deleted",
+                deleted,
+                freed / 1024 / 1024,
+            )
+        )
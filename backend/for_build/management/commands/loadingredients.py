@@ -1,22 +1,86 @@
 import csv
+import json
+import os
+from itertools import islice
 
-from django.core.management.base import BaseCommand
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
 
+from api.cache import bump_version
 from recipes.models import Ingredient
 
+BATCH_SIZE = 500
+CSV_HEADER = ["name", "measurement_unit"]
+
+
+def read_csv(path):
+    with open(path, encoding="utf-8", newline="") as csvfile:
+        for row in csv.reader(csvfile):
+            if row and row != CSV_HEADER:
+                yield row[0].strip(), row[1].strip()
+
+
+def read_json(path):
+    with open(path, encoding="utf-8") as jsonfile:
+        for item in json.load(jsonfile):
+            yield item["name"].strip(), item["measurement_unit"].strip()
+
+
+READERS = {
+    ".csv": read_csv,
+    ".json": read_json,
+}
+
 
 class Command(BaseCommand):
-    help = "load ingredients to base from `../data/ingredients.csv`"
+    help = "load ingredients to base from `data/ingredients.csv` or `.json`"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "path",
+            nargs="?",
+            default=os.path.join(settings.BASE_DIR, "data", "ingredients.csv"),
+            help="path to ingredients.csv or ingredients.json",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="only report ingredients that would be added",
+        )
 
     def handle(self, *args, **kwargs):
-        with open("data/ingredients.csv", encoding="utf-8") as csvfile:
-            csvreader = csv.reader(csvfile)
-            next(csvreader)
-            for row in csvreader:
-                if not Ingredient.objects.filter(name=row[0]).exists():
-                    print("add ingredient {}".format(row[0]))
-                    Ingredient.objects.update_or_create(
-                        name=row[0],
-                        measurement_unit=row[1],
-                    )
-            print("ingredients added successfully")
+        path = kwargs["path"]
+        reader = READERS.get(os.path.splitext(path)[1].lower())
+        if reader is None:
+            raise CommandError("expected a .csv or .json file")
+        if not os.path.exists(path):
+            raise CommandError("file {} not found".format(path))
+        verbosity = kwargs["verbosity"]
+
+        existing = set(Ingredient.objects.values_list("name", flat=True))
+        new = {}
+        for name, measurement_unit in reader(path):
+            if name and name not in existing and name not in new:
+                new[name] = measurement_unit
+                if verbosity > 1:
+                    self.stdout.write("add ingredient {}".format(name))
+
+        if kwargs["dry_run"]:
+            self.stdout.write("{} ingredients would be added".format(len(new)))
+            return
+        ingredients = (
+            Ingredient(name=name, measurement_unit=measurement_unit)
+            for name, measurement_unit in new.items()
+        )
+        with transaction.atomic():
+            while True:
+                batch = list(islice(ingredients, BATCH_SIZE))
+                if not batch:
+                    break
+                Ingredient.objects.bulk_create(batch, ignore_conflicts=True)
+        bump_version("ingredients")
+        if verbosity > 0:
+            self.stdout.write(
+                "ingredients added successfully: {}".format(len(new))
+            )
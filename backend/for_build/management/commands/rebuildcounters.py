@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from cart.models import ShoppingCart
+from recipes.models import Favorite, Follow, Recipe
+from users.models import User
+
+
+def count_subquery(queryset, field):
+    counts = (
+        queryset.filter(**{field: OuterRef("pk")})
+        .order_by()
+        .values(field)
+        .annotate(total=Count("pk"))
+        .values("total")
+    )
+    return Coalesce(Subquery(counts, output_field=IntegerField()), 0)
+
+
+class Command(BaseCommand):
+    help = "rebuild favorite, cart, follower and recipe counters"
+
+    def handle(self, *args, **kwargs):
+        with transaction.atomic():
+            recipes = Recipe.objects.update(
+                favorites_count=count_subquery(
+                    Favorite.objects.all(), "recipe"
+                ),
+                carts_count=count_subquery(
+                    ShoppingCart.objects.all(), "recipe"
+                ),
+            )
+            users = User.objects.update(
+                followers_count=count_subquery(Follow.objects.all(), "author"),
+                recipes_count=count_subquery(Recipe.objects.all(), "author"),
+            )
+        self.stdout.write(
+            f"counters rebuilt: {recipes} recipes, {users} users"
+        )
@@ -0,0 +1,51 @@
+from itertools import islice
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from recipes.models import FeedEntry, Recipe
+
+BATCH_SIZE = 1000
+
+
+class Command(BaseCommand):
+    help = (
+        "rebuild subscription feeds: fan out recipes of authors with at "
+        "most FEED_FANOUT_LIMIT followers, the rest are read on request"
+    )
+
+    def handle(self, *args, **kwargs):
+        pushed = Recipe.objects.filter(
+            author__followers_count__lte=settings.FEED_FANOUT_LIMIT
+        )
+        rows = (
+            pushed.filter(author__follow_author__isnull=False)
+            .values_list(
+                "author__follow_author__user", "author_id", "id", "pub_date"
+            )
+            .iterator(chunk_size=BATCH_SIZE)
+        )
+        entries = (
+            FeedEntry(
+                user_id=user_id,
+                author_id=author_id,
+                recipe_id=recipe_id,
+                pub_date=pub_date,
+            )
+            for user_id, author_id, recipe_id, pub_date in rows
+        )
+        with transaction.atomic():
+            FeedEntry.objects.all().delete()
+            Recipe.objects.update(fanned_out=False)
+            while True:
+                batch = list(islice(entries, BATCH_SIZE))
+                if not batch:
+                    break
+                FeedEntry.objects.bulk_create(batch)
+            recipes = pushed.update(fanned_out=True)
+        self.stdout.write(
+            "feeds rebuilt: {} entries for {} recipes".format(
+                FeedEntry.objects.count(), recipes
+            )
+        )
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from cart.models import ShoppingListItem
+
+
+class Command(BaseCommand):
+    help = "rebuild materialized shopping list totals from shopping carts"
+
+    def handle(self, *args, **kwargs):
+        ShoppingListItem.objects.rebuild()
+        self.stdout.write(
+            "shopping lists rebuilt: {} rows".format(
+                ShoppingListItem.objects.count()
+            )
+        )
@@ -0,0 +1,79 @@
+from collections import defaultdict
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from cart.models import ShoppingCart
+from recipes.models import Favorite, Recipe
+
+BATCH_SIZE = 1000
+
+
+def get_trending_scores(now, window, half_life):
+    """Сумма добавлений в избранное и корзину с затуханием по времени"""
+    scores = defaultdict(float)
+    since = now - window
+    for model in (Favorite, ShoppingCart):
+        added = (
+            model.objects.filter(pub_date__gte=since)
+            .values_list("recipe_id", "pub_date")
+            .iterator(chunk_size=BATCH_SIZE)
+        )
+        for recipe_id, pub_date in added:
+            scores[recipe_id] += 0.5 ** ((now - pub_date) / half_life)
+    return scores
+
+
+class Command(BaseCommand):
+    help = (
+        "precompute popular and trending scores of recipes, "
+        "meant to be run periodically"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--half-life",
+            type=float,
+            default=48,
+            help="hours after which an addition counts half, default 48",
+        )
+        parser.add_argument(
+            "--window",
+            type=int,
+            default=14,
+            help="days of additions counted for trending, default 14",
+        )
+
+    def handle(self, *args, **kwargs):
+        if kwargs["half_life"] <= 0 or kwargs["window"] <= 0:
+            raise CommandError("--half-life and --window must be positive")
+        scores = get_trending_scores(
+            timezone.now(),
+            timedelta(days=kwargs["window"]),
+            timedelta(hours=kwargs["half_life"]),
+        )
+        with transaction.atomic():
+            # строки с неизменным счетом не переписываются: иначе каждый
+            # запуск обновлял бы всю таблицу и индекс популярности
+            popularity = F("favorites_count") + F("carts_count")
+            popular = Recipe.objects.exclude(
+                popularity_score=popularity
+            ).update(popularity_score=popularity)
+            Recipe.objects.filter(trending_score__gt=0).update(
+                trending_score=0
+            )
+            Recipe.objects.bulk_update(
+                [
+                    Recipe(pk=recipe_id, trending_score=score)
+                    for recipe_id, score in scores.items()
+                ],
+                ["trending_score"],
+                batch_size=BATCH_SIZE,
+            )
+        self.stdout.write(
+            f"scores updated: {popular} popular, "
+            f"{len(scores)} trending recipes"
+        )
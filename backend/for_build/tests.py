@@ -0,0 +1,42 @@
+from io import StringIO
+from unittest import skipUnless
+
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import TestCase
+
+from api.tests import RecipeDataMixin
+from recipes.models import Recipe
+
+
+@skipUnless(
+    connection.vendor == "postgresql",
+    "query plans are checked on PostgreSQL only",
+)
+class QueryPlansTest(RecipeDataMixin, TestCase):
+    """Горячие эндпоинты API читают таблицы только по индексам"""
+
+    def test_hot_endpoints_use_indexes(self):
+        stderr = StringIO()
+        try:
+            call_command("checkqueryplans", stdout=StringIO(), stderr=stderr)
+        except CommandError as error:
+            self.fail(f"{error}\n{stderr.getvalue()}")
+
+
+class UpdateScoresTest(RecipeDataMixin, TestCase):
+    """Пересчет популярности переписывает только изменившиеся рецепты"""
+
+    def test_only_changed_rows(self):
+        recipe = self.recipes[0]
+        Recipe.objects.filter(pk=recipe.pk).update(
+            favorites_count=3, carts_count=2
+        )
+        stdout = StringIO()
+        call_command("updatescores", stdout=stdout)
+        self.assertIn("1 popular", stdout.getvalue())
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.popularity_score, 5)
+        stdout = StringIO()
+        call_command("updatescores", stdout=stdout)
+        self.assertIn("0 popular", stdout.getvalue())
@@ -1,4 +1,7 @@
+from functools import partial
+
 from django.contrib.admin import ModelAdmin, TabularInline, site
+from django.db import transaction
 
 from .models import (
     Favorite,
@@ -9,6 +12,7 @@ from .models import (
     RecipeTag,
     Tag,
 )
+from api.search import recipe_ingredient_index
 
 
 class RecipeIngredientAmountInLine(TabularInline):
@@ -80,6 +84,12 @@ class RecipeAdmin(ModelAdmin):
     )
     empty_value_field = "-пусто-"
 
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        transaction.on_commit(
+            partial(recipe_ingredient_index.mark_changed, form.instance.pk)
+        )
+
 
 class FollowAdmin(ModelAdmin):
     list_display = (
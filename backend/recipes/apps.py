@@ -1,5 +1,16 @@
 from django.apps import AppConfig
+from django.db import connections
+from django.db.models.signals import post_migrate
+
+
+def restore_fulltext_triggers(using, **kwargs):
+    from .fulltext import restore_sqlite_triggers
+
+    restore_sqlite_triggers(connections[using])
 
 
 class RecipesConfig(AppConfig):
     name = "recipes"
+
+    def ready(self):
+        post_migrate.connect(restore_fulltext_triggers, sender=self)
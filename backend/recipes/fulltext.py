@@ -0,0 +1,120 @@
+"""Полнотекстовый индекс рецептов: tsvector на PostgreSQL, FTS5 на SQLite"""
+
+SEARCH_VECTOR_SQL = (
+    "setweight(to_tsvector('russian', coalesce({row}name, '')), 'A') || "
+    "setweight(to_tsvector('russian', coalesce({row}text, '')), 'B')"
+)
+POSTGRESQL_INSTALL_SQL = (
+    "CREATE OR REPLACE FUNCTION recipes_recipe_search_vector_update() "
+    "RETURNS trigger AS $$ BEGIN "
+    "NEW.search_vector := {}; RETURN NEW; "
+    "END $$ LANGUAGE plpgsql".format(SEARCH_VECTOR_SQL.format(row="NEW.")),
+    "DROP TRIGGER IF EXISTS recipes_recipe_search_vector ON recipes_recipe",
+    "CREATE TRIGGER recipes_recipe_search_vector "
+    "BEFORE INSERT OR UPDATE OF name, text ON recipes_recipe "
+    "FOR EACH ROW EXECUTE FUNCTION recipes_recipe_search_vector_update()",
+    "UPDATE recipes_recipe SET search_vector = {}".format(
+        SEARCH_VECTOR_SQL.format(row="")
+    ),
+    "CREATE INDEX IF NOT EXISTS recipe_search_vector_idx "
+    "ON recipes_recipe USING gin (search_vector)",
+)
+POSTGRESQL_UNINSTALL_SQL = (
+    "DROP INDEX IF EXISTS recipe_search_vector_idx",
+    "DROP TRIGGER IF EXISTS recipes_recipe_search_vector ON recipes_recipe",
+    "DROP FUNCTION IF EXISTS recipes_recipe_search_vector_update()",
+)
+
+SQLITE_DELETE_SQL = (
+    "INSERT INTO recipes_recipe_fts (recipes_recipe_fts, rowid, name, text) "
+    "VALUES ('delete', old.id, old.name, old.text);"
+)
+SQLITE_TRIGGERS = {
+    "recipes_recipe_fts_insert": (
+        "CREATE TRIGGER IF NOT EXISTS recipes_recipe_fts_insert "
+        "AFTER INSERT ON recipes_recipe BEGIN "
+        "INSERT INTO recipes_recipe_fts (rowid, name, text) "
+        "VALUES (new.id, new.name, new.text); END"
+    ),
+    "recipes_recipe_fts_delete": (
+        "CREATE TRIGGER IF NOT EXISTS recipes_recipe_fts_delete "
+        "AFTER DELETE ON recipes_recipe BEGIN " + SQLITE_DELETE_SQL + " END"
+    ),
+    "recipes_recipe_fts_update": (
+        "CREATE TRIGGER IF NOT EXISTS recipes_recipe_fts_update "
+        "AFTER UPDATE OF name, text ON recipes_recipe BEGIN "
+        + SQLITE_DELETE_SQL
+        + " INSERT INTO recipes_recipe_fts (rowid, name, text) "
+        "VALUES (new.id, new.name, new.text); END"
+    ),
+}
+SQLITE_TABLE_SQL = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS recipes_recipe_fts "
+    "USING fts5(name, text, content='recipes_recipe', content_rowid='id')"
+)
+SQLITE_REBUILD_SQL = (
+    "INSERT INTO recipes_recipe_fts (recipes_recipe_fts) VALUES ('rebuild')"
+)
+SQLITE_UNINSTALL_SQL = (
+    *("DROP TRIGGER IF EXISTS {}".format(name) for name in SQLITE_TRIGGERS),
+    "DROP TABLE IF EXISTS recipes_recipe_fts",
+)
+
+
+def sqlite_has_fts5(cursor):
+    cursor.execute("PRAGMA compile_options")
+    return "ENABLE_FTS5" in {row[0] for row in cursor.fetchall()}
+
+
+def sqlite_fts_ready(connection):
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM sqlite_master WHERE name = 'recipes_recipe_fts'"
+        )
+        return cursor.fetchone() is not None
+
+
+def install(connection):
+    with connection.cursor() as cursor:
+        if connection.vendor == "postgresql":
+            for sql in POSTGRESQL_INSTALL_SQL:
+                cursor.execute(sql)
+        elif connection.vendor == "sqlite" and sqlite_has_fts5(cursor):
+            cursor.execute(SQLITE_TABLE_SQL)
+            for sql in SQLITE_TRIGGERS.values():
+                cursor.execute(sql)
+            cursor.execute(SQLITE_REBUILD_SQL)
+
+
+def uninstall(connection):
+    statements = {
+        "postgresql": POSTGRESQL_UNINSTALL_SQL,
+        "sqlite": SQLITE_UNINSTALL_SQL,
+    }
+    with connection.cursor() as cursor:
+        for sql in statements.get(connection.vendor, ()):
+            cursor.execute(sql)
+
+
+def restore_sqlite_triggers(connection):
+    """Возвращает триггеры FTS5, удаленные при пересоздании таблицы
+
+    Миграции на SQLite пересоздают `recipes_recipe` вместе с триггерами,
+    поэтому после них недостающие триггеры создаются снова, а индекс
+    перестраивается.
+    """
+    if connection.vendor != "sqlite" or not sqlite_fts_ready(connection):
+        return
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT name FROM sqlite_master WHERE type = 'trigger'")
+        existing = {row[0] for row in cursor.fetchall()}
+        missing = [
+            sql
+            for name, sql in SQLITE_TRIGGERS.items()
+            if name not in existing
+        ]
+        if not missing:
+            return
+        for sql in missing:
+            cursor.execute(sql)
+        cursor.execute(SQLITE_REBUILD_SQL)
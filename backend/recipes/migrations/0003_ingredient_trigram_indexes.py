@@ -0,0 +1,37 @@
+from django.db import migrations
+
+TRIGRAM_INDEXES_SQL = (
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX IF NOT EXISTS recipes_ingredient_name_trgm "
+    "ON recipes_ingredient USING gin (name gin_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS recipes_ingredient_name_upper_trgm "
+    "ON recipes_ingredient USING gin (UPPER(name::text) gin_trgm_ops)",
+)
+DROP_TRIGRAM_INDEXES_SQL = (
+    "DROP INDEX IF EXISTS recipes_ingredient_name_trgm",
+    "DROP INDEX IF EXISTS recipes_ingredient_name_upper_trgm",
+)
+
+
+def run_on_postgresql(statements):
+    def operation(apps, schema_editor):
+        if schema_editor.connection.vendor != "postgresql":
+            return
+        for sql in statements:
+            schema_editor.execute(sql)
+
+    return operation
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("recipes", "0002_initial"),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            run_on_postgresql(TRIGRAM_INDEXES_SQL),
+            run_on_postgresql(DROP_TRIGRAM_INDEXES_SQL),
+        ),
+    ]
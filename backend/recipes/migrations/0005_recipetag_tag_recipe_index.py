@@ -0,0 +1,19 @@
+# Generated by Django 3.2.15 on 2026-10-18 16:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("recipes", "0004_recipe_ordering"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="recipetag",
+            index=models.Index(
+                fields=["tag", "recipe"], name="recipetag_tag_recipe_idx"
+            ),
+        ),
+    ]
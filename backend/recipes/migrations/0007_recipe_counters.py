@@ -0,0 +1,59 @@
+# Generated by Django 3.2.15 on 2026-10-18 16:54
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_subquery(queryset, field):
+    counts = (
+        queryset.filter(**{field: OuterRef("pk")})
+        .order_by()
+        .values(field)
+        .annotate(total=Count("pk"))
+        .values("total")
+    )
+    return Coalesce(Subquery(counts, output_field=IntegerField()), 0)
+
+
+def fill_counters(apps, schema_editor):
+    Recipe = apps.get_model("recipes", "Recipe")
+    Favorite = apps.get_model("recipes", "Favorite")
+    Follow = apps.get_model("recipes", "Follow")
+    ShoppingCart = apps.get_model("cart", "ShoppingCart")
+    User = apps.get_model("users", "User")
+    Recipe.objects.update(
+        favorites_count=count_subquery(Favorite.objects.all(), "recipe"),
+        carts_count=count_subquery(ShoppingCart.objects.all(), "recipe"),
+    )
+    User.objects.update(
+        followers_count=count_subquery(Follow.objects.all(), "author"),
+        recipes_count=count_subquery(Recipe.objects.all(), "author"),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("recipes", "0006_hot_path_indexes"),
+        ("users", "0002_user_counters"),
+        ("cart", "0005_hot_path_indexes"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="recipe",
+            name="carts_count",
+            field=models.PositiveIntegerField(
+                default=0, editable=False, verbose_name="В списках покупок"
+            ),
+        ),
+        migrations.AddField(
+            model_name="recipe",
+            name="favorites_count",
+            field=models.PositiveIntegerField(
+                default=0, editable=False, verbose_name="В избранном"
+            ),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,68 @@
+# Generated by Django 3.2.15 on 2026-10-18 16:55
+
+from django.db import migrations, models
+from django.db.models import F, OuterRef, Subquery
+import django.utils.timezone
+
+
+def fill_scores(apps, schema_editor):
+    Favorite = apps.get_model("recipes", "Favorite")
+    Recipe = apps.get_model("recipes", "Recipe")
+    Favorite.objects.update(
+        pub_date=Subquery(
+            Recipe.objects.filter(pk=OuterRef("recipe")).values("pub_date")
+        )
+    )
+    Recipe.objects.update(
+        popularity_score=F("favorites_count") + F("carts_count")
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("recipes", "0007_recipe_counters"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="favorite",
+            name="pub_date",
+            field=models.DateTimeField(
+                auto_now_add=True,
+                db_index=True,
+                default=django.utils.timezone.now,
+            ),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name="recipe",
+            name="popularity_score",
+            field=models.PositiveIntegerField(
+                default=0, editable=False, verbose_name="Популярность"
+            ),
+        ),
+        migrations.AddField(
+            model_name="recipe",
+            name="trending_score",
+            field=models.FloatField(
+                default=0,
+                editable=False,
+                verbose_name="Популярность за последнее время",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="recipe",
+            index=models.Index(
+                fields=["-popularity_score", "-id"],
+                name="recipe_popularity_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="recipe",
+            index=models.Index(
+                fields=["-trending_score", "-id"], name="recipe_trending_idx"
+            ),
+        ),
+        migrations.RunPython(fill_scores, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 3.2.15 on 2026-10-18 17:01
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+from recipes import fulltext
+
+
+def install_fulltext(apps, schema_editor):
+    fulltext.install(schema_editor.connection)
+
+
+def uninstall_fulltext(apps, schema_editor):
+    fulltext.uninstall(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("recipes", "0009_feed"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="recipe",
+            name="search_vector",
+            field=django.contrib.postgres.search.SearchVectorField(
+                editable=False, null=True
+            ),
+        ),
+        migrations.RunPython(install_fulltext, uninstall_fulltext),
+    ]
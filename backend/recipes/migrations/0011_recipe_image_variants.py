@@ -0,0 +1,22 @@
+# Generated by Django 3.2.15 on 2026-10-18 17:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("recipes", "0010_recipe_fulltext"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="recipe",
+            name="image_variants",
+            field=models.JSONField(
+                default=dict,
+                editable=False,
+                verbose_name="Уменьшенные копии картинки",
+            ),
+        ),
+    ]
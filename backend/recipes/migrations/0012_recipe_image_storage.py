@@ -0,0 +1,23 @@
+# Generated by Django 3.2.15 on 2026-10-18 17:08
+
+from django.db import migrations, models
+import recipes.storage
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("recipes", "0011_recipe_image_variants"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="recipe",
+            name="image",
+            field=models.ImageField(
+                storage=recipes.storage.HashedFileSystemStorage(),
+                upload_to="recipes/images/",
+                verbose_name="Картинка",
+            ),
+        ),
+    ]
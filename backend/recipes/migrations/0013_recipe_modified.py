@@ -0,0 +1,18 @@
+# Generated by Django 3.2.15 on 2026-10-18 17:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("recipes", "0012_recipe_image_storage"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="recipe",
+            name="modified",
+            field=models.DateTimeField(auto_now=True, verbose_name="Изменен"),
+        ),
+    ]
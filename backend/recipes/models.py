@@ -1,9 +1,20 @@
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
+from django.db.models import F
 
+from .storage import recipe_image_storage
 from .validators import HexColorValidator
 from users.models import User
 
 
+def change_counter(model, pk, field, delta):
+    """Атомарно изменяет денормализованный счётчик, не опуская его ниже 0"""
+    queryset = model.objects.filter(pk=pk)
+    if delta < 0:
+        queryset = queryset.filter(**{f"{field}__gte": -delta})
+    queryset.update(**{field: F(field) + delta})
+
+
 class Tag(models.Model):
     """Модель тегов"""
 
@@ -76,6 +87,12 @@ class Recipe(models.Model):
     image = models.ImageField(
         verbose_name="Картинка",
         upload_to="recipes/images/",
+        storage=recipe_image_storage,
+    )
+    image_variants = models.JSONField(
+        verbose_name="Уменьшенные копии картинки",
+        default=dict,
+        editable=False,
     )
     text = models.TextField(
         verbose_name="Описание",
@@ -101,6 +118,35 @@ class Recipe(models.Model):
         blank=False,
     )
     pub_date = models.DateTimeField(auto_now_add=True)
+    # входит в ключ кэшированного фрагмента рецепта, см. api.cache
+    modified = models.DateTimeField(verbose_name="Изменен", auto_now=True)
+    favorites_count = models.PositiveIntegerField(
+        verbose_name="В избранном",
+        default=0,
+        editable=False,
+    )
+    carts_count = models.PositiveIntegerField(
+        verbose_name="В списках покупок",
+        default=0,
+        editable=False,
+    )
+    popularity_score = models.PositiveIntegerField(
+        verbose_name="Популярность",
+        default=0,
+        editable=False,
+    )
+    trending_score = models.FloatField(
+        verbose_name="Популярность за последнее время",
+        default=0,
+        editable=False,
+    )
+    fanned_out = models.BooleanField(
+        verbose_name="Разослан в ленты подписчиков",
+        default=False,
+        editable=False,
+    )
+    # заполняется триггером, GIN индекс создается миграцией, см. fulltext
+    search_vector = SearchVectorField(null=True, editable=False)
 
     class Meta:
         constraints = [
@@ -109,7 +155,30 @@ class Recipe(models.Model):
                 fields=["author", "name"],
             ),
         ]
-        ordering = ("-pub_date",)
+        indexes = [
+            models.Index(
+                fields=["-pub_date", "-id"],
+                name="recipe_pub_date_id_idx",
+            ),
+            models.Index(
+                fields=["author", "-pub_date"],
+                name="recipe_author_pub_date_idx",
+            ),
+            models.Index(
+                fields=["-popularity_score", "-id"],
+                name="recipe_popularity_idx",
+            ),
+            models.Index(
+                fields=["-trending_score", "-id"],
+                name="recipe_trending_idx",
+            ),
+            models.Index(
+                fields=["author", "-pub_date"],
+                condition=models.Q(fanned_out=False),
+                name="recipe_pulled_author_idx",
+            ),
+        ]
+        ordering = ("-pub_date", "-id")
         verbose_name = "Рецепт"
         verbose_name_plural = "Рецепты"
 
@@ -158,6 +227,14 @@ class RecipeTag(models.Model):
         verbose_name="Тэг",
     )
 
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["tag", "recipe"],
+                name="recipetag_tag_recipe_idx",
+            ),
+        ]
+
 
 class Follow(models.Model):
     """Модель подписок"""
@@ -182,6 +259,12 @@ class Follow(models.Model):
                 name="unique_follow",
             )
         ]
+        indexes = [
+            models.Index(
+                fields=["author", "user"],
+                name="follow_author_user_idx",
+            ),
+        ]
         verbose_name = "Подписка"
         verbose_name_plural = "Подписки"
 
@@ -201,6 +284,7 @@ class Favorite(models.Model):
         related_name="favorite",
         verbose_name="Избранный рецепт",
     )
+    pub_date = models.DateTimeField(auto_now_add=True, db_index=True)
 
     class Meta:
         constraints = [
@@ -211,3 +295,47 @@ class Favorite(models.Model):
         ]
         verbose_name = "Избранное"
         verbose_name_plural = "Избранное"
+
+
+class FeedEntry(models.Model):
+    """Модель ленты рецептов из подписок"""
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name="feed",
+        verbose_name="Подписчик",
+    )
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name="+",
+        verbose_name="Автор рецепта",
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name="feed_entries",
+        verbose_name="Рецепт",
+    )
+    pub_date = models.DateTimeField(verbose_name="Дата публикации")
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "recipe"],
+                name="unique_feed_entry",
+            )
+        ]
+        indexes = [
+            models.Index(
+                fields=["user", "-pub_date", "-recipe"],
+                name="feed_user_pub_date_idx",
+            ),
+            models.Index(
+                fields=["user", "author"],
+                name="feed_user_author_idx",
+            ),
+        ]
+        verbose_name = "Запись ленты"
+        verbose_name_plural = "Ленты подписок"
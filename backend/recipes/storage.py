@@ -0,0 +1,41 @@
+import hashlib
+import os
+import posixpath
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+
+@deconstructible
+class HashedFileSystemStorage(FileSystemStorage):
+    """Хранилище, где имя файла — SHA-256 его содержимого
+
+    Одинаковые файлы записываются один раз: `upload_to/ab/abcd….jpg`.
+    Содержимое файла под таким именем не меняется, поэтому его можно
+    кэшировать навсегда. Файлы не удаляются при замене картинки, ненужные
+    удаляет команда `cleanimages`.
+    """
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, "chunks"):
+            content = File(content, name)
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        digest = digest.hexdigest()
+        name = posixpath.join(
+            posixpath.dirname(name),
+            digest[:2],
+            digest + os.path.splitext(name)[1].lower(),
+        )
+        if self.exists(name):
+            # файл уже есть, отметка времени защищает его от cleanimages
+            os.utime(self.path(name))
+            return name
+        return super().save(name, content, max_length=max_length)
+
+
+recipe_image_storage = HashedFileSystemStorage()
@@ -42,6 +42,16 @@ class User(AbstractUser):
         db_index=True,
     )
     role = models.SlugField(choices=ROLES, default=USER)
+    followers_count = models.PositiveIntegerField(
+        verbose_name="Подписчики",
+        default=0,
+        editable=False,
+    )
+    recipes_count = models.PositiveIntegerField(
+        verbose_name="Рецепты",
+        default=0,
+        editable=False,
+    )
     REQUIRED_FIELDS = [
         "password",
         "first_name",